@@ -0,0 +1,301 @@
+"""
+A persistent, on-disk, cache of encoded sentence graphs.
+
+Encoding the sentences and building their graphs is repeated every epoch,
+and for every run of the scripts. The cache stores the node and edge data
+of all graphs once, and GraphDataset builds the graphs from it when it is
+given a cache_dir.
+
+The cache for a dataset is a directory in the cache_dir, with:
+  meta.json          version, key, and sizes
+  shard-NNNNN/       per SHARD_SIZE sentences, one numpy file per array:
+    labels.npy       uint8 [nodes, label dims], the one-hot encoded features
+    wvec.npy         float32 [nodes, encoder dims], the WVEC feature, if used
+    frame.npy        int64 [nodes]
+    role.npy         int64 [nodes]
+    node_offsets.npy int64 [sentences + 1], first node of each sentence
+    src.npy          int32 [edges], source node, within the sentence
+    dst.npy          int32 [edges], destination node, within the sentence
+    rel_type.npy     int8 [edges]
+    norm.npy         float32 [edges]
+    edge_offsets.npy int64 [sentences + 1], first edge of each sentence
+
+The node features 'v' are the label columns with the WVEC columns inserted
+at meta['wvec'] = [start, end]; the one-hot encodings hold small counts,
+so they are stored as bytes, which makes the cache 4x smaller.
+
+The shards are opened with numpy.memmap, so they are shared between
+DataLoader workers, and only the pages that are used are read.
+
+The cache is keyed by a hash of the input file (or corpus directory),
+the features, and the identity of the sentence encoder; when the input
+changes, the cache is stale, and it is rebuilt.
+"""
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from .graph import graph_arrays
+from .labels import get_dims_for_features
+from .storage import MemoryMapped, write_directory, save_array, load_array, \
+    write_meta, read_meta
+
+
+CACHE_VERSION = 1
+
+# number of sentences per shard
+SHARD_SIZE = 10000
+
+# number of shards to keep open, per GraphCache
+MAX_OPEN_SHARDS = 16
+
+NODE_ARRAYS = {'frame': np.int64, 'role': np.int64}
+EDGE_ARRAYS = {
+    'src': np.int32, 'dst': np.int32, 'rel_type': np.int8, 'norm': np.float32
+    }
+
+
+def file_hash(filename):
+    """
+    The sha256 of a file, or of all files in a directory, as hex string.
+    """
+    if os.path.isdir(filename):
+        names = sorted(os.listdir(filename))
+        filenames = [os.path.join(filename, name) for name in names]
+    else:
+        names = [os.path.basename(filename)]
+        filenames = [filename]
+
+    sha = hashlib.sha256()
+    for name, path in zip(names, filenames):
+        sha.update(name.encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def encoder_identity(sentence_encoder):
+    """A string identifying the sentence encoder, or None."""
+    if sentence_encoder is None:
+        return None
+    return getattr(sentence_encoder, 'identity', sentence_encoder.name)
+
+
+def cache_path(cache_dir, filename, features, sentence_encoder=None):
+    """
+    The directory of the cache for a file, features, and encoder.
+
+    The input is identified by its absolute path, so a changed file maps
+    to the same directory, and replaces its stale cache.
+    """
+    if 'WVEC' not in features:
+        sentence_encoder = None
+
+    key = json.dumps([
+        os.path.abspath(filename),
+        list(features),
+        encoder_identity(sentence_encoder)
+        ])
+    return os.path.join(cache_dir, '{}-{}'.format(
+        os.path.basename(os.path.normpath(filename)),
+        hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        ))
+
+
+def write_graph_cache(sentences, path, meta, features, sentence_encoder=None):
+    """
+    Encode sentences, and write the graph cache.
+
+    The cache is written to a temporary directory first, see
+    stroll.storage.write_directory, and replaces the directory at path.
+
+    Arguments:
+        sentences:         iterable of Sentence
+        path:              output directory
+        meta:              dict, key of the cache, stored in meta.json
+        features:          list of str, the features to use as node data 'v'
+        sentence_encoder:  optional sentence encoder for the WVEC feature
+    """
+    # the columns of the WVEC feature in 'v'
+    wvec = None
+    if 'WVEC' in features:
+        start = get_dims_for_features(features[:features.index('WVEC')])
+        wvec = [start, start + sentence_encoder.dims]
+
+    with write_directory(path) as tmp_path:
+        shard = []
+        shards = 0
+        count = 0
+        for sentence in sentences:
+            shard.append(graph_arrays(sentence, features, sentence_encoder))
+            count += 1
+            if len(shard) == SHARD_SIZE:
+                _write_shard(
+                    shard, os.path.join(tmp_path, _shard_name(shards)), wvec
+                )
+                shard = []
+                shards += 1
+        if shard:
+            _write_shard(
+                shard, os.path.join(tmp_path, _shard_name(shards)), wvec
+            )
+            shards += 1
+
+        meta = dict(meta)
+        meta['version'] = CACHE_VERSION
+        meta['wvec'] = wvec
+        meta['sentences'] = count
+        meta['shards'] = shards
+        meta['shard_size'] = SHARD_SIZE
+        write_meta(tmp_path, meta)
+
+
+def _shard_name(shard):
+    return 'shard-{:05d}'.format(shard)
+
+
+def _write_shard(graphs, path, wvec):
+    os.makedirs(path)
+
+    v = torch.cat([g['v'] for g in graphs]).numpy()
+    if wvec:
+        save_array(path, 'wvec', v[:, wvec[0]:wvec[1]], np.float32)
+        v = np.concatenate([v[:, :wvec[0]], v[:, wvec[1]:]], axis=1)
+    if not np.array_equal(v, v.astype(np.uint8)):
+        raise ValueError('One-hot features do not fit in the graph cache')
+    save_array(path, 'labels', v, np.uint8)
+
+    for name, dtype in NODE_ARRAYS.items():
+        save_array(
+            path, name, torch.cat([g[name] for g in graphs]).numpy(), dtype
+        )
+    for name, dtype in EDGE_ARRAYS.items():
+        save_array(
+            path, name, torch.cat([g[name] for g in graphs]).numpy(), dtype
+        )
+
+    node_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum([len(g['frame']) for g in graphs], out=node_offsets[1:])
+    save_array(path, 'node_offsets', node_offsets)
+
+    edge_offsets = np.zeros(len(graphs) + 1, dtype=np.int64)
+    np.cumsum([len(g['src']) for g in graphs], out=edge_offsets[1:])
+    save_array(path, 'edge_offsets', edge_offsets)
+
+
+class GraphCache(MemoryMapped):
+    """
+    Read-only access to a graph cache directory.
+
+    Indexing it gives the arrays of a sentence graph, in the format of
+    stroll.graph.graph_arrays:
+        arrays = cache[10]
+    """
+    def __init__(self, path):
+        self.path = path
+        self.meta = read_meta(path, CACHE_VERSION, 'cache')
+
+        # the most recently used shards, opened when needed
+        self._shards = OrderedDict()
+
+    def __len__(self):
+        return self.meta['sentences']
+
+    def _shard(self, shard):
+        if shard in self._shards:
+            self._shards.move_to_end(shard)
+        else:
+            shard_path = os.path.join(self.path, _shard_name(shard))
+
+            def load(name):
+                return load_array(shard_path, name)
+
+            arrays = {name: load(name) for name in NODE_ARRAYS}
+            arrays['labels'] = load('labels')
+            if self.meta['wvec']:
+                arrays['wvec'] = load('wvec')
+            arrays.update({name: load(name) for name in EDGE_ARRAYS})
+            arrays['node_offsets'] = load('node_offsets')
+            arrays['edge_offsets'] = load('edge_offsets')
+            self._shards[shard] = arrays
+
+            # every array keeps a file open
+            if len(self._shards) > MAX_OPEN_SHARDS:
+                self._shards.popitem(last=False)
+        return self._shards[shard]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Sentence index out of range')
+
+        shard, i = divmod(index, self.meta['shard_size'])
+        arrays = self._shard(shard)
+        n0, n1 = arrays['node_offsets'][i:i + 2]
+        e0, e1 = arrays['edge_offsets'][i:i + 2]
+
+        # copy the slices out of the read-only memory map
+        result = {}
+        for name in NODE_ARRAYS:
+            result[name] = torch.from_numpy(np.array(arrays[name][n0:n1]))
+        for name in EDGE_ARRAYS:
+            result[name] = torch.from_numpy(np.array(arrays[name][e0:e1]))
+        for name in ['src', 'dst', 'rel_type']:
+            result[name] = result[name].long()
+
+        v = arrays['labels'][n0:n1].astype(np.float32)
+        wvec = self.meta['wvec']
+        if wvec:
+            v = np.concatenate(
+                [v[:, :wvec[0]], arrays['wvec'][n0:n1], v[:, wvec[0]:]],
+                axis=1
+            )
+        result['v'] = torch.from_numpy(v)
+        return result
+
+
+def open_graph_cache(cache_dir, filename, dataset, features,
+                     sentence_encoder=None):
+    """
+    Open the graph cache for a file, building it if it is missing or stale.
+
+    Arguments:
+        cache_dir:         directory holding the caches
+        filename:          the input file, or binary corpus directory
+        dataset:           the sentences of the file, used for building
+        features:          list of str, the features to use as node data 'v'
+        sentence_encoder:  optional sentence encoder for the WVEC feature
+
+    Returns:
+        GraphCache
+    """
+    path = cache_path(cache_dir, filename, features, sentence_encoder)
+    if 'WVEC' not in features:
+        sentence_encoder = None
+    meta = {
+        'source': os.path.abspath(filename),
+        'hash': file_hash(filename),
+        'features': list(features),
+        'encoder': encoder_identity(sentence_encoder)
+        }
+
+    try:
+        cache = GraphCache(path)
+        if all(cache.meta.get(k) == v for k, v in meta.items()):
+            logging.info('Using graph cache {}'.format(path))
+            return cache
+        logging.info('Graph cache {} is stale'.format(path))
+    except (FileNotFoundError, ValueError):
+        pass
+
+    logging.info('Building graph cache {}'.format(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    write_graph_cache(dataset, path, meta, features, sentence_encoder)
+    return GraphCache(path)
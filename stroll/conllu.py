@@ -1,12 +1,24 @@
 import logging
+import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset
 from .labels import upos_codec, xpos_codec, deprel_codec, feats_codec, \
         frame_codec, role_codec
 from .labels import to_one_hot, to_index
+from .labels import upos_index, xpos_index, deprel_index, feats_index, \
+        frame_index, role_index
 from .labels import ROLES, FRAMES
+from array import array
 from collections import OrderedDict
+from contextlib import contextmanager
+from io import StringIO
+import gc
+import gzip
+import lzma
+import multiprocessing
 import os
+import sys
+import zlib
 
 
 COPULA_NOUN_DESC_MOVE_TO_VERB = [
@@ -16,8 +28,27 @@ COPULA_NOUN_DESC_MOVE_TO_VERB = [
         ]
 
 
+def _intern(value):
+    """Intern strings, but pass encoded values (tensors) as they are."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
 class Token():
-    """A class representing a single token, ie. a word, with its annotation."""
+    """
+    A class representing a single token, ie. a word, with its annotation.
+
+    To keep large datasets small, tokens have no __dict__, and the
+    annotations with few distinct values (ie. UPOS, DEPREL) are interned,
+    so all tokens share a single copy of each string.
+    """
+    __slots__ = [
+        'isEncoded', 'ID', 'FORM', 'LEMMA', 'UPOS', 'XPOS', 'FEATS', 'HEAD',
+        'DEPREL', 'DEPS', 'MISC', 'FRAME', 'ROLE', 'pFRAME', 'pROLE', 'COREF',
+        'WVEC', 'nafid'
+        ]
+
     def __init__(self, fields, isEncoded=False):
         self.isEncoded = isEncoded
         if len(fields) < 10:
@@ -25,22 +56,22 @@ class Token():
                'Incorrect number of fields in sentence: {}'.format(len(fields))
                )
         else:
-            self.ID = fields[0]
+            self.ID = _intern(fields[0])
             self.FORM = fields[1]
             self.LEMMA = fields[2]
-            self.UPOS = fields[3]
-            self.XPOS = fields[4]
-            self.FEATS = fields[5]
-            self.HEAD = fields[6]
-            self.DEPREL = fields[7]
-            self.DEPS = fields[8]
-            self.MISC = fields[9]
+            self.UPOS = _intern(fields[3])
+            self.XPOS = _intern(fields[4])
+            self.FEATS = _intern(fields[5])
+            self.HEAD = _intern(fields[6])
+            self.DEPREL = _intern(fields[7])
+            self.DEPS = _intern(fields[8])
+            self.MISC = _intern(fields[9])
 
         # Treat fields 10 and 11 as frame and role
         # NOTE: this a private extension the to conllu format
         if len(fields) >= 12:
-            self.FRAME = fields[10]
-            self.ROLE = fields[11]
+            self.FRAME = _intern(fields[10])
+            self.ROLE = _intern(fields[11])
             self.pFRAME = 1.
             self.pROLE = 1.
         else:
@@ -50,7 +81,7 @@ class Token():
             self.pROLE = 0.
 
         if len(fields) >= 13:
-            self.COREF = fields[12]
+            self.COREF = _intern(fields[12])
         else:
             self.COREF = '_'
 
@@ -68,6 +99,15 @@ class Token():
                 self.FRAME, self.ROLE, self.COREF
                 )
 
+    def __getstate__(self):
+        # a plain tuple pickles smaller and faster than the default dict;
+        # unset attributes (ie. nafid) are restored as None
+        return tuple(getattr(self, name, None) for name in Token.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(Token.__slots__, state):
+            setattr(self, name, value)
+
     def __getitem__(self, index):
         if index == 'UPOS':
             return self.UPOS
@@ -105,6 +145,113 @@ class Token():
             ], isEncoded=True)
 
 
+# per feature: the LabelIndex, and if it holds a '|' separated list
+_FEATURE_INDICES = {
+    'UPOS': (upos_index, False),
+    'XPOS': (xpos_index, True),
+    'FEATS': (feats_index, True),
+    'DEPREL': (deprel_index, False),
+}
+
+
+class DependencyTree():
+    """
+    The dependency tree of a sentence, as integer arrays and lists.
+
+    The subtrees come from a single depth first traversal from the root,
+    made when first needed; the subtree of a token is a contiguous span
+    of the (pre-order) traversal:
+        order[start[i]:end[i]]
+
+    Tokens without a head (HEAD '0' or '_') are roots. Tokens on a cycle
+    are visited after the roots, from the first of them.
+
+    properties:
+        heads:     numpy int array, the index of the head per token, or -1
+        children:  list of list of int, the children per token, in
+                   sentence order
+        depth:     numpy int array, the number of arcs to the root
+        order:     numpy int array, the token indices in traversal order
+        start:     numpy int array, the start of each subtree in order
+        end:       numpy int array, the end of each subtree in order
+    """
+    def __init__(self, sentence):
+        n = len(sentence)
+        heads = [-1] * n
+        self.children = [[] for i in range(n)]
+        for i, token in enumerate(sentence):
+            if token.HEAD != '0' and token.HEAD != '_':
+                head = sentence.index(token.HEAD)
+                heads[i] = head
+                self.children[head].append(i)
+        self.heads = np.array(heads, dtype=np.int64)
+        self._spans = None
+
+    def __len__(self):
+        return len(self.heads)
+
+    def _traverse(self):
+        n = len(self.heads)
+        order = []
+        start = [0] * n
+        end = [0] * n
+        depth = [0] * n
+        visited = [False] * n
+
+        # start at the roots; tokens left over are on a cycle
+        roots = np.flatnonzero(self.heads == -1).tolist()
+        for root in roots + list(range(n)):
+            if visited[root]:
+                continue
+            stack = [(root, False)]
+            while stack:
+                i, leaving = stack.pop()
+                if leaving:
+                    end[i] = len(order)
+                    continue
+                if visited[i]:
+                    continue
+                visited[i] = True
+                start[i] = len(order)
+                order.append(i)
+
+                stack.append((i, True))
+                for child in reversed(self.children[i]):
+                    depth[child] = depth[i] + 1
+                    stack.append((child, False))
+
+        # lists for subtree(), which is faster on them for short sentences
+        self._spans = (order, start, end, depth)
+
+    def _span_array(self, i):
+        if self._spans is None:
+            self._traverse()
+        return np.array(self._spans[i], dtype=np.int64)
+
+    @property
+    def order(self):
+        return self._span_array(0)
+
+    @property
+    def start(self):
+        return self._span_array(1)
+
+    @property
+    def end(self):
+        return self._span_array(2)
+
+    @property
+    def depth(self):
+        return self._span_array(3)
+
+    def subtree(self, i):
+        """The indices of the tokens in the subtree of token i, in order."""
+        if self._spans is None:
+            self._traverse()
+        order, start, end, _ = self._spans
+        return sorted(order[start[i]:end[i]])
+
+
 class Sentence():
     """
     A class representing a sentence.
@@ -125,7 +272,16 @@ class Sentence():
         doc_rank   the document's rank (first, second, ..) in the dataset
         sent_rank  the sentence's rank (first, second, ..) in the document
         tokens     the list of tokens that make up the sentence
+        tree       the DependencyTree of the tokens, built when first used
+
+    NOTE: after changing the tokens in place (ie. a Token.HEAD), call
+    sentence.changed() to rebuild the lookup table and tree.
     """
+    __slots__ = [
+        'sent_id', 'full_text', 'sent_rank', 'doc_rank', 'doc_id', 'dataset',
+        'tokens', '_id_to_index', '_tree'
+        ]
+
     def __init__(self,
                  sent_id=None,
                  full_text=None
@@ -138,6 +294,7 @@ class Sentence():
         self.dataset = None
         self.tokens = []
         self._id_to_index = None  # maps Token.ID to int index in sentence
+        self._tree = None  # DependencyTree, shared by graphs and frames
 
     def __len__(self):
         return len(self.tokens)
@@ -166,13 +323,23 @@ class Sentence():
         for i, token in enumerate(self.tokens):
             self._id_to_index[token.ID] = i
 
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = DependencyTree(self)
+        return self._tree
+
+    def changed(self):
+        # force rebuilding of the ID lookup table and dependency tree
+        self._id_to_index = None
+        self._tree = None
+
     def add(self, token):
         # TODO: see if we can keep those tokens.
         if token.ID.find('.') == -1:
             self.tokens.append(token)
 
-        # force rebuilding of the ID lookup table and adjacency matrix
-        self._id_to_index = None
+        self.changed()
 
     def set_full_text(self, full_text):
         self.full_text = full_text
@@ -200,6 +367,134 @@ class Sentence():
 
         return encoded_sentence
 
+    def encode_batch(self, features, sentence_encoder=None):
+        """
+        Encode all tokens at once, without making an encoded Sentence.
+
+        Gives the same values as Sentence.encode, with the features of
+        each token concatenated in the order of the features argument.
+
+        Arguments:
+            features:          list of str, from 'UPOS', 'XPOS', 'FEATS',
+                               'DEPREL', and 'WVEC'
+            sentence_encoder:  sentence encoder, needed for 'WVEC'
+
+        Returns:
+            v      float tensor [len(sentence), number of feature dims]
+            frame  int64 tensor [len(sentence)], the index of the FRAME
+            role   int64 tensor [len(sentence)], the index of the ROLE
+        """
+        # collect the (token, column) pairs of all ones in the one-hot
+        # encodings, and set them in a single operation
+        rows = []
+        cols = []
+        offset = 0
+        wvec_offset = None
+        for feature in features:
+            if feature == 'WVEC':
+                wvec_offset = offset
+                offset += sentence_encoder.dims
+                continue
+
+            label_index, split = _FEATURE_INDICES[feature]
+            for i, token in enumerate(self.tokens):
+                labels = getattr(token, feature)
+                labels = labels.split('|') if split else [labels]
+                for col in label_index.transform(labels):
+                    rows.append(i)
+                    cols.append(offset + col)
+            offset += len(label_index)
+
+        v = torch.zeros(len(self.tokens), offset)
+        v.index_put_(
+            (torch.tensor(rows, dtype=torch.int64),
+             torch.tensor(cols, dtype=torch.int64)),
+            torch.ones(len(rows)),
+            accumulate=True
+        )
+
+        if wvec_offset is not None and len(self.tokens):
+            vectors = sentence_encoder(self)
+            if not isinstance(vectors, torch.Tensor):
+                vectors = torch.stack(list(vectors))
+            v[:, wvec_offset:wvec_offset + sentence_encoder.dims] = vectors
+
+        frame = torch.tensor(
+            frame_index.transform([token.FRAME for token in self.tokens]),
+            dtype=torch.int64
+        )
+        role = torch.tensor(
+            role_index.transform([token.ROLE for token in self.tokens]),
+            dtype=torch.int64
+        )
+        return v, frame, role
+
+    def encode_indices(self, features, sentence_encoder=None):
+        """
+        Encode all tokens as indices of their labels, instead of one-hot.
+
+        The label indices number the columns of the one-hot encodings of
+        Sentence.encode_batch, leaving out the WVEC columns, starting at 1.
+        Per token, the indices are padded with 0, so the ones in row i of
+        the one-hot encoding are at columns labels[i][labels[i] > 0] - 1.
+
+        Arguments:
+            features:          list of str, from 'UPOS', 'XPOS', 'FEATS',
+                               'DEPREL', and 'WVEC'
+            sentence_encoder:  sentence encoder, needed for 'WVEC'
+
+        Returns:
+            labels  int32 tensor [len(sentence), most labels of a token]
+            wvec    float tensor [len(sentence), encoder dims], or
+                    [len(sentence), 0] without 'WVEC'
+            frame   int64 tensor [len(sentence)], the index of the FRAME
+            role    int64 tensor [len(sentence)], the index of the ROLE
+        """
+        # collect the (token, position, index) of all labels, and set them
+        # in a single operation
+        rows = []
+        positions = []
+        indices = []
+        counts = [0] * len(self.tokens)
+        offset = 1
+        for feature in features:
+            if feature == 'WVEC':
+                continue
+
+            label_index, split = _FEATURE_INDICES[feature]
+            for i, token in enumerate(self.tokens):
+                labels = getattr(token, feature)
+                labels = labels.split('|') if split else [labels]
+                for col in label_index.transform(labels):
+                    rows.append(i)
+                    positions.append(counts[i])
+                    indices.append(offset + col)
+                    counts[i] += 1
+            offset += len(label_index)
+
+        labels = torch.zeros(
+            [len(self.tokens), max(counts + [0])], dtype=torch.int32
+        )
+        labels[rows, positions] = torch.tensor(indices, dtype=torch.int32)
+
+        if 'WVEC' in features and len(self.tokens):
+            wvec = sentence_encoder(self)
+            if not isinstance(wvec, torch.Tensor):
+                wvec = torch.stack(list(wvec))
+        else:
+            dims = sentence_encoder.dims if 'WVEC' in features else 0
+            wvec = torch.zeros(len(self.tokens), dims)
+
+        frame = torch.tensor(
+            frame_index.transform([token.FRAME for token in self.tokens]),
+            dtype=torch.int64
+        )
+        role = torch.tensor(
+            role_index.transform([token.ROLE for token in self.tokens]),
+            dtype=torch.int64
+        )
+        return labels, wvec, frame, role
+
 
 class ConlluDataset(Dataset):
     """
@@ -217,159 +512,106 @@ class ConlluDataset(Dataset):
     def __init__(self, filename=None):
         self.sentences = []
         self.doc_lengths = OrderedDict()
+        self._doc_ranks = {}  # maps Sentence.doc_id to Sentence.doc_rank
         self._id_to_index = None  # maps sentence.sent_id to int index in dataset
 
         if filename is not None:
             self._load(filename)
 
     def __repr__(self):
-        res = ''
-        current_doc_id = ''
-        first = True
+        res = StringIO()
+        self.dump(res)
+
+        # the written file ends with an empty line, the repr does not
+        return res.getvalue()[:-1]
+
+    def dump(self, fh):
+        """Write the dataset in conll-u format to an open file handle."""
+        writer = ConlluWriter(fh)
         for sentence in self:
-            if not first:
-                res += '\n'
-
-            # keep track of the current document
-            if sentence.doc_id != current_doc_id:
-                current_doc_id = sentence.doc_id
-                if not first:
-                    res += '\n'
-                res += '# newdoc id = {}\n'.format(sentence.doc_id)
-            res += sentence.__repr__()
-            res += '\n'
-
-            if first:
-                first = False
-        return res
+            writer.write(sentence)
+        writer.flush()
+
+    def to_binary(self, path):
+        """Write the dataset in the binary corpus format, see stroll.corpus"""
+        from .corpus import write_binary
+        write_binary(self, path)
+
+    @classmethod
+    def from_binary(cls, path):
+        """Load a dataset from a binary corpus directory, see stroll.corpus"""
+        from .corpus import BinaryCorpus
+        return BinaryCorpus(path).to_dataset()
 
     def load_conll2012(self, filename):
         logging.info("Opening {}".format(filename))
 
-        with open(filename, "r") as f:
-            conll2012_raw = f.readlines()
-
-        sent_rank = 1
-        full_text = []
-        sentence = Sentence()
-        doc_current_id = filename  # use the filename as default doc_id
-        for line in conll2012_raw:
-
-            # remove possible trailing newline and whitespace
-            line = line.rstrip()
-
-            # #begin document (dpc-bmm-001086-nl-sen); part 000
-            if line[0:15] == '#begin document':
-                doc_current_id = line[17:]
-                try:
-                    end = doc_current_id.index(')')
-                    doc_current_id = doc_current_id[:end]
-                except ValueError:
-                    pass
-
-            # #end document
-            elif line[0:13] == '#end document':
-                doc_current_id = filename  # use the filename as default doc_id
-                sent_rank = 1
-
-            # <newline> is sentence separator
-            elif len(line) == 0:
-                if len(sentence) > 0:
-                    sentence.doc_id = doc_current_id
-                    sentence.sent_id = '{}'.format(sent_rank)
-                    sentence.full_text = ' '.join(full_text)
-                    self.add(sentence)
-                    sent_rank += 1
-
-                # start a new sentence
-                sentence = Sentence()
-                full_text = []
-
-            # dpc-bmm-001086-nl-sen   0   Deze   (261
-            else:
-                fields = line.split()
-                sentence.add(Token([
-                  '{}'.format(len(sentence) + 1),  # ID = fields[0]
-                  fields[2],  # FORM = fields[1]
-                  '',  # LEMMA = fields[2]
-                  '_',  # UPOS = fields[3]
-                  '_',  # XPOS = fields[4]
-                  '_',  # FEATS = fields[5]
-                  '_',  # HEAD = fields[6]
-                  '_',  # DEPREL = fields[7]
-                  '_',  # DEPS = fields[8]
-                  '_',  # MISC = fields[9]
-                  '_',  # FRAME = fields[10]
-                  '_'   # ROLE = fields[11]
-                ]))
-                full_text.append(fields[2])
+        with open_file(filename, "r") as f:
+            self.extend(_read_conll2012(f, filename))
 
     def _load(self, filename):
         logging.info("Opening {}".format(filename))
 
-        with open(filename, "r") as f:
-            conllu_raw = f.readlines()
-
-        # sent_id = 116
-        # text = Wie kan optreden ?
-        # <12 columns tab separated, 1 line per token in the sentence>
-        # <empty line>
-        sentence = Sentence()
-        doc_current_id = os.path.basename(filename)
-        for line in conllu_raw:
-
-            # remove possible trailing newline and whitespace
-            line = line.rstrip()
-
-            if line[0:12] == '# sent_id = ':
-                # store sentence id
-                sentence.set_sent_id(line[12:])
-                continue
-            elif line[0:9] == '# text = ':
-                # store sentence full text
-                sentence.set_full_text(line[9:])
-                continue
-            elif line[0:8] == '# newdoc':
-                # store doc id if present: '# newdoc id = mf920901-001'
-                if len(line) > 14:
-                    doc_current_id = line[14:]
-                else:
-                    doc_current_id = '{filename}-{:06d}'.format(
-                            filename, len(self.doc_lengths))
-            elif line[0:1] == '#':
-                # ignore comments
-                continue
-            elif len(line) == 0:
-                # newline means end of a sentence
-                if len(sentence) > 0:
-                    sentence.doc_id = doc_current_id
-                    self.add(sentence)
-
-                # start a new sentence
-                sentence = Sentence()
-            else:
-                fields = line.split('\t')
-                sentence.add(Token(fields))
-
-        # if the file does not end in an empty line,
-        # assume the sentence is finished and add it anyways
-        if len(sentence) > 0:
-            sentence.doc_id = doc_current_id
-            self.add(sentence)
+        with open_file(filename, "r") as f:
+            self.extend(_read_conllu(f, filename))
+
+    def load_many(self, filenames, workers=None, format='conllu'):
+        """
+        Parse a list of files in a pool of processes, and add them in order.
+
+        The sentences get the same doc_rank and sent_rank as when the
+        files are loaded one after the other.
+
+        Arguments:
+            filenames:  list of str
+            workers:    int, number of processes, defaults to the number
+                        of cpus. With 1 worker the files are parsed in
+                        this process.
+            format:     'conllu' or 'conll2012'
+        """
+        if format not in ['conllu', 'conll2012']:
+            raise ValueError('Unknown format {}'.format(format))
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(filenames))
+
+        jobs = [(filename, format) for filename in filenames]
+        with _gc_paused():
+            if workers <= 1:
+                for job in jobs:
+                    self.extend(_parse_file(job))
+                return
+
+            # imap returns the results in the order of the files
+            with multiprocessing.Pool(workers) as pool:
+                for sentences in pool.imap(_parse_file, jobs):
+                    self.extend(sentences)
 
     def add(self, sentence):
-        if sentence.doc_id in self.doc_lengths:
-            sentence.sent_rank = self.doc_lengths[sentence.doc_id]
-            self.doc_lengths[sentence.doc_id] += 1
-        else:
-            sentence.sent_rank = 0
-            self.doc_lengths[sentence.doc_id] = 1
+        self.extend([sentence])
+
+    def extend(self, sentences):
+        """
+        Add sentences to the dataset.
+
+        Arguments:
+            sentences:  iterable of Sentence, ie. a list or a generator
+        """
+        doc_lengths = self.doc_lengths
+        doc_ranks = self._doc_ranks
+        for sentence in sentences:
+            if sentence.doc_id in doc_lengths:
+                sentence.sent_rank = doc_lengths[sentence.doc_id]
+                doc_lengths[sentence.doc_id] += 1
+            else:
+                sentence.sent_rank = 0
+                doc_lengths[sentence.doc_id] = 1
+                doc_ranks[sentence.doc_id] = len(doc_ranks)
 
-        sentence.doc_rank = \
-            list(self.doc_lengths.keys()).index(sentence.doc_id)
+            sentence.doc_rank = doc_ranks[sentence.doc_id]
 
-        sentence.dataset = self
-        self.sentences.append(sentence)
+            sentence.dataset = self
+            self.sentences.append(sentence)
 
         # force rebuilding of the sent_id lookup table
         self._id_to_index = None
@@ -411,3 +653,471 @@ class ConlluDataset(Dataset):
                 frame_counts[token.FRAME] = frame_counts[token.FRAME] + 1
 
         return role_counts, frame_counts
+
+
+class ConlluWriter():
+    """
+    Write sentences in conll-u format, one at a time.
+
+    Sentences are written token by token to the file handle, and a
+    '# newdoc id' line is inserted whenever the doc_id changes.
+    The file handle is flushed at the end of each document, so output
+    can be consumed while the rest of the data is still being processed:
+        writer = ConlluWriter(sys.stdout)
+        for sentence in dataset:
+            writer.write(sentence)
+        writer.flush()
+    """
+    def __init__(self, fh):
+        self.fh = fh
+        self.current_doc_id = ''
+        self.first = True
+
+    def write(self, sentence):
+        fh = self.fh
+
+        # keep track of the current document; sentences without doc_id
+        # at the start get no '# newdoc id' line
+        if sentence.doc_id != self.current_doc_id:
+            if not self.first:
+                fh.flush()
+                fh.write('\n')
+            self.current_doc_id = sentence.doc_id
+            fh.write('# newdoc id = {}\n'.format(sentence.doc_id))
+
+        fh.write('# sent_id = {}\n'.format(sentence.sent_id))
+        fh.write('# text = {}\n'.format(sentence.full_text))
+        for token in sentence:
+            fh.write(token.__repr__())
+            fh.write('\n')
+        fh.write('\n')
+
+        self.first = False
+
+    def flush(self):
+        self.fh.flush()
+
+
+def _read_conllu(lines, filename):
+    """
+    Parse conll-u formatted lines, and yield the sentences one by one.
+
+    The sentences get their doc_id set, but are not added to a dataset;
+    ranks are assigned by the caller.
+
+    Arguments:
+        lines:     iterable of str, ie. an open file
+        filename:  str, used to make default document identifiers
+    """
+    # sent_id = 116
+    # text = Wie kan optreden ?
+    # <12 columns tab separated, 1 line per token in the sentence>
+    # <empty line>
+    sentence = Sentence()
+    doc_current_id = os.path.basename(filename)
+    doc_count = 0
+    for line in lines:
+
+        # remove possible trailing newline and whitespace
+        line = line.rstrip()
+
+        if line[0:12] == '# sent_id = ':
+            # store sentence id
+            sentence.set_sent_id(line[12:])
+            continue
+        elif line[0:9] == '# text = ':
+            # store sentence full text
+            sentence.set_full_text(line[9:])
+            continue
+        elif line[0:8] == '# newdoc':
+            # store doc id if present: '# newdoc id = mf920901-001'
+            if len(line) > 14:
+                doc_current_id = line[14:]
+            else:
+                doc_current_id = '{}-{:06d}'.format(filename, doc_count)
+            doc_count += 1
+        elif line[0:1] == '#':
+            # ignore comments
+            continue
+        elif len(line) == 0:
+            # newline means end of a sentence
+            if len(sentence) > 0:
+                sentence.doc_id = doc_current_id
+                yield sentence
+
+            # start a new sentence
+            sentence = Sentence()
+        else:
+            fields = line.split('\t')
+            sentence.add(Token(fields))
+
+    # if the file does not end in an empty line,
+    # assume the sentence is finished and add it anyways
+    if len(sentence) > 0:
+        sentence.doc_id = doc_current_id
+        yield sentence
+
+
+def _compression(filename):
+    """The compression of a file from its extension, or None."""
+    for extension in ['.gz', '.xz', '.zst']:
+        if filename.endswith(extension):
+            return extension[1:]
+    return None
+
+
+def open_file(filename, mode='r'):
+    """
+    Open a text file, (de)compressing it on the fly.
+
+    The codec is chosen by the extension: .gz (gzip), .xz (lzma), or .zst
+    (needs the zstandard package); other files are opened as-is.
+    The data is streamed, and never fully held in memory.
+
+    Arguments:
+        filename:  str
+        mode:      'r', 'w', or 'a'
+    """
+    compression = _compression(filename)
+    if compression == 'gz':
+        return gzip.open(filename, mode + 't', encoding='utf-8')
+    elif compression == 'xz':
+        return lzma.open(filename, mode + 't', encoding='utf-8')
+    elif compression == 'zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                'Install the zstandard package to read or write {}'.format(
+                    filename
+                ))
+        return zstandard.open(filename, mode + 't', encoding='utf-8')
+    return open(filename, mode)
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the garbage collector while making many long-lived objects.
+
+    Otherwise it scans the growing list of tokens over and over, which
+    takes about a third of the time when loading a large file.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _parse_file(job):
+    """Parse a file for ConlluDataset.load_many, in a worker process."""
+    filename, format = job
+    logging.info("Opening {}".format(filename))
+
+    with _gc_paused(), open_file(filename, "r") as f:
+        if format == 'conll2012':
+            return list(_read_conll2012(f, filename))
+        return list(_read_conllu(f, filename))
+
+
+def _read_conll2012(lines, filename):
+    """
+    Parse conll2012 formatted lines, and yield the sentences one by one.
+
+    Only the words are used; all other fields of the tokens are left empty.
+
+    Arguments:
+        lines:     iterable of str, ie. an open file
+        filename:  str, used as default document identifier
+    """
+    sent_rank = 1
+    full_text = []
+    sentence = Sentence()
+    doc_current_id = filename  # use the filename as default doc_id
+    for line in lines:
+
+        # remove possible trailing newline and whitespace
+        line = line.rstrip()
+
+        # #begin document (dpc-bmm-001086-nl-sen); part 000
+        if line[0:15] == '#begin document':
+            doc_current_id = line[17:]
+            try:
+                end = doc_current_id.index(')')
+                doc_current_id = doc_current_id[:end]
+            except ValueError:
+                pass
+
+        # #end document
+        elif line[0:13] == '#end document':
+            doc_current_id = filename  # use the filename as default doc_id
+            sent_rank = 1
+
+        # <newline> is sentence separator
+        elif len(line) == 0:
+            if len(sentence) > 0:
+                sentence.doc_id = doc_current_id
+                sentence.sent_id = '{}'.format(sent_rank)
+                sentence.full_text = ' '.join(full_text)
+                yield sentence
+                sent_rank += 1
+
+            # start a new sentence
+            sentence = Sentence()
+            full_text = []
+
+        # dpc-bmm-001086-nl-sen   0   Deze   (261
+        else:
+            fields = line.split()
+            sentence.add(Token([
+              '{}'.format(len(sentence) + 1),  # ID = fields[0]
+              fields[2],  # FORM = fields[1]
+              '',  # LEMMA = fields[2]
+              '_',  # UPOS = fields[3]
+              '_',  # XPOS = fields[4]
+              '_',  # FEATS = fields[5]
+              '_',  # HEAD = fields[6]
+              '_',  # DEPREL = fields[7]
+              '_',  # DEPS = fields[8]
+              '_',  # MISC = fields[9]
+              '_',  # FRAME = fields[10]
+              '_'   # ROLE = fields[11]
+            ]))
+            full_text.append(fields[2])
+
+
+class ConlluStream(IterableDataset):
+    """
+    A conll-u file, read as a stream of sentences.
+
+    The file is parsed lazily, while iterating; only the sentence being
+    yielded is kept in memory. The sentences get the same sent_rank and
+    doc_rank as when the file is loaded into a ConlluDataset:
+        for sent in ConlluStream('big.conllu')
+
+    properties:
+        filename     name of the conll-u file
+        doc_lengths  dict of number of sentences per doc,
+                     indexed by Sentence.doc_id; filled while iterating
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.doc_lengths = OrderedDict()
+        self._doc_ranks = {}
+
+    def __iter__(self):
+        # start counting from scratch on every pass over the file
+        self.doc_lengths = OrderedDict()
+        self._doc_ranks = {}
+
+        logging.info("Opening {}".format(self.filename))
+        with open_file(self.filename, "r") as f:
+            for sentence in _read_conllu(f, self.filename):
+                if sentence.doc_id in self.doc_lengths:
+                    sentence.sent_rank = self.doc_lengths[sentence.doc_id]
+                    self.doc_lengths[sentence.doc_id] += 1
+                else:
+                    sentence.sent_rank = 0
+                    self.doc_lengths[sentence.doc_id] = 1
+                    self._doc_ranks[sentence.doc_id] = len(self._doc_ranks)
+
+                sentence.doc_rank = self._doc_ranks[sentence.doc_id]
+                sentence.dataset = self
+                yield sentence
+
+
+class LazyConlluDataset(Dataset):
+    """
+    A conll-u dataset that is read from disk only when needed.
+
+    A sidecar index file (filename + '.idx') with the byte offset, ranks,
+    sent_id and doc_id of every sentence is built on first use, and rebuilt
+    when the conll-u file changes. Indexing a sentence seeks to its offset
+    and parses only that sentence, so random access (ie. a shuffled
+    DataLoader) works without loading the whole file:
+        sent = Dataset[10]
+        sent = Dataset['sent_id']
+        for sent in Dataset
+
+    NOTE: every access makes a new Sentence, changes to it are not stored.
+
+    properties:
+        filename     name of the conll-u file
+        doc_lengths  dict of number of sentences per doc,
+                     indexed by Sentence.doc_id
+    """
+    def __init__(self, filename):
+        if _compression(filename):
+            raise ValueError(
+                'Cannot seek in compressed file {}, decompress it or '
+                'convert it to a binary corpus'.format(filename)
+            )
+
+        self.filename = filename
+        self._fh = None
+        self._fh_pid = None
+
+        entries = _read_index(filename)
+        if entries is None:
+            entries = _build_index(filename)
+
+        self.doc_lengths = OrderedDict()
+        self._doc_ranks = {}
+        offsets = array('q')
+        sent_ranks = array('i')
+        doc_ranks = array('i')
+        hashes = array('I')
+        for offset, sent_id, doc_id in entries:
+            if doc_id in self.doc_lengths:
+                sent_ranks.append(self.doc_lengths[doc_id])
+                self.doc_lengths[doc_id] += 1
+            else:
+                sent_ranks.append(0)
+                self.doc_lengths[doc_id] = 1
+                self._doc_ranks[doc_id] = len(self._doc_ranks)
+            doc_ranks.append(self._doc_ranks[doc_id])
+            offsets.append(offset)
+            hashes.append(_id_hash(sent_id))
+
+        self._doc_ids = list(self.doc_lengths.keys())
+        self._offsets = np.frombuffer(offsets, dtype=np.int64)
+        self._sent_ranks = np.frombuffer(sent_ranks, dtype=np.int32)
+        self._doc_rank_of = np.frombuffer(doc_ranks, dtype=np.int32)
+
+        # sent_id lookup: sorted hashes of the sent_ids, and their index
+        hashes = np.frombuffer(hashes, dtype=np.uint32)
+        self._hash_order = np.argsort(hashes, kind='stable')
+        self._sorted_hashes = hashes[self._hash_order]
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            index = self.index(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Sentence index out of range')
+
+        sentence = self._parse_at(self._offsets[index])
+        doc_rank = int(self._doc_rank_of[index])
+        sentence.doc_id = self._doc_ids[doc_rank]
+        sentence.doc_rank = doc_rank
+        sentence.sent_rank = int(self._sent_ranks[index])
+        sentence.dataset = self
+        return sentence
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def index(self, ID):
+        # look up the candidates by hash, and check their sent_id
+        h = _id_hash(ID)
+        first = np.searchsorted(self._sorted_hashes, h, side='left')
+        last = np.searchsorted(self._sorted_hashes, h, side='right')
+        for i in self._hash_order[first:last]:
+            if self._parse_at(self._offsets[i]).sent_id == ID:
+                return int(i)
+        raise KeyError(ID)
+
+    def _parse_at(self, offset):
+        # open a file handle per process, so DataLoader workers don't share
+        # the file position
+        if self._fh is None or self._fh_pid != os.getpid():
+            self._fh = open(self.filename, 'rb')
+            self._fh_pid = os.getpid()
+
+        self._fh.seek(offset)
+        lines = (line.decode('utf-8') for line in self._fh)
+        return next(_read_conllu(lines, self.filename))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fh'] = None
+        return state
+
+
+INDEX_VERSION = 1
+
+
+def _id_hash(sent_id):
+    # a hash that is the same in every process, unlike hash()
+    return zlib.crc32((sent_id or '').encode('utf-8'))
+
+
+def _index_name(filename):
+    return filename + '.idx'
+
+
+def _index_header(filename):
+    stat = os.stat(filename)
+    return '# stroll-index {} {} {}\n'.format(
+        INDEX_VERSION, stat.st_size, stat.st_mtime_ns
+    )
+
+
+def _read_index(filename):
+    """
+    Read the sidecar index of a conll-u file.
+
+    Returns:
+        list of (offset, sent_id, doc_id), or None if there is no index,
+        or if it is out of date.
+    """
+    try:
+        with open(_index_name(filename), 'r') as f:
+            if f.readline() != _index_header(filename):
+                logging.info('Index for {} is out of date'.format(filename))
+                return None
+            entries = []
+            for line in f:
+                offset, sent_id, doc_id = line.rstrip('\n').split('\t')
+                entries.append((int(offset), sent_id or None, doc_id))
+            return entries
+    except FileNotFoundError:
+        return None
+
+
+def _build_index(filename):
+    """
+    Build the sidecar index of a conll-u file, by parsing it once.
+
+    Returns:
+        list of (offset, sent_id, doc_id)
+    """
+    logging.info('Building index for {}'.format(filename))
+
+    # keep track of the byte offset where each sentence starts,
+    # ie. the first line after an empty line
+    state = {'start': 0}
+
+    def lines_with_offsets(f):
+        offset = 0
+        after_empty_line = True
+        for line in f:
+            if after_empty_line:
+                state['start'] = offset
+            offset += len(line)
+            line = line.decode('utf-8')
+            after_empty_line = len(line.strip()) == 0
+            yield line
+
+    entries = []
+    with open(filename, 'rb') as f:
+        for sentence in _read_conllu(lines_with_offsets(f), filename):
+            entries.append((state['start'], sentence.sent_id, sentence.doc_id))
+
+    try:
+        with open(_index_name(filename), 'w') as f:
+            f.write(_index_header(filename))
+            for offset, sent_id, doc_id in entries:
+                f.write('{}\t{}\t{}\n'.format(offset, sent_id or '', doc_id))
+    except OSError:
+        logging.warning('Could not write index for {}'.format(filename))
+
+    return entries
@@ -0,0 +1,313 @@
+"""
+A binary, memory-mapped, corpus format.
+
+The corpus is stored in a directory, with one numpy file per column:
+  strings.npy         utf-8 encoded bytes of all distinct strings
+  string_offsets.npy  start of each string in strings.npy (plus the end)
+  <FIELD>.npy         per token: index in the string table, for all
+                      text fields (ID, FORM, LEMMA, UPOS, ..)
+  HEAD.npy            per token: the head as integer, or -1 for '_'
+  ncols.npy           per token: 13, or 10 when it has no SRL annotation
+  token_offsets.npy   per sentence: index of its first token (plus the end)
+  sent_id.npy         per sentence: index in the string table
+  full_text.npy       per sentence: index in the string table
+  doc_rank.npy        per sentence: index in doc_id.npy
+  sent_rank.npy       per sentence: rank of the sentence in its document
+  doc_id.npy          per document: index in the string table
+  meta.json           version and sizes
+
+Missing values (ie. a sentence without sent_id) are stored as -1.
+The arrays are opened with numpy.memmap, so opening a corpus is fast,
+takes little memory, and the pages are shared between processes.
+
+Convert a conllu file with:
+    python -m stroll.corpus input.conllu output_dir
+"""
+import argparse
+import functools
+import logging
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+from torch.utils.data import Dataset
+
+from .conllu import ConlluDataset, ConlluStream, Sentence, Token
+from .storage import MemoryMapped, write_directory, save_array, load_array, \
+    write_meta, read_meta
+
+
+FORMAT_VERSION = 1
+
+# number of decoded strings to keep, per BinaryCorpus
+STRING_CACHE_SIZE = 65536
+
+# number of sentences to make at once when reading the full corpus
+CHUNK_SIZE = 4096
+
+TEXT_FIELDS = [
+    'ID', 'FORM', 'LEMMA', 'UPOS', 'XPOS', 'FEATS', 'DEPREL', 'DEPS', 'MISC',
+    'FRAME', 'ROLE', 'COREF'
+    ]
+
+parser = argparse.ArgumentParser(
+    description='Convert a conllu file to the binary corpus format.'
+)
+parser.add_argument(
+    'input',
+    help='Input file in conllu format'
+)
+parser.add_argument(
+    'output',
+    help='Output directory'
+)
+
+
+class _StringTable():
+    """Assign an index to each distinct string"""
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def __call__(self, string):
+        if string is None:
+            return -1
+        idx = self.index.get(string)
+        if idx is None:
+            idx = len(self.strings)
+            self.index[string] = idx
+            self.strings.append(string)
+        return idx
+
+    def save(self, path):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        save_array(path, 'string_offsets', offsets)
+        save_array(
+            path, 'strings', np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        )
+
+
+def write_binary(sentences, path):
+    """
+    Write sentences to a directory in the binary corpus format.
+
+    The corpus is written to a temporary directory first, see
+    stroll.storage.write_directory, and replaces the directory at path.
+
+    Arguments:
+        sentences:  iterable of Sentence, ie. a ConlluDataset or ConlluStream
+        path:       output directory
+    """
+    strings = _StringTable()
+    columns = {field: array('i') for field in TEXT_FIELDS}
+    heads = array('i')
+    ncols = array('B')
+
+    token_offsets = array('q', [0])
+    sent_ids = array('i')
+    full_texts = array('i')
+    doc_ranks = array('i')
+    sent_ranks = array('i')
+    doc_ids = OrderedDict()
+    doc_lengths = {}
+
+    for sentence in sentences:
+        for token in sentence:
+            for field in TEXT_FIELDS:
+                columns[field].append(strings(getattr(token, field)))
+
+            heads.append(-1 if token.HEAD == '_' else int(token.HEAD))
+
+            # tokens without the SRL columns get pFRAME = pROLE = 0
+            if token.pFRAME == 0. and token.FRAME == '_' and \
+                    token.ROLE == '_' and token.COREF == '_':
+                ncols.append(10)
+            else:
+                ncols.append(13)
+
+        token_offsets.append(token_offsets[-1] + len(sentence))
+        sent_ids.append(strings(sentence.sent_id))
+        full_texts.append(strings(sentence.full_text))
+
+        if sentence.doc_id not in doc_ids:
+            doc_ids[sentence.doc_id] = len(doc_ids)
+            doc_lengths[sentence.doc_id] = 0
+        doc_ranks.append(doc_ids[sentence.doc_id])
+        sent_ranks.append(doc_lengths[sentence.doc_id])
+        doc_lengths[sentence.doc_id] += 1
+
+    with write_directory(path) as tmp_path:
+        for field in TEXT_FIELDS:
+            save_array(tmp_path, field, columns[field], np.int32)
+        save_array(tmp_path, 'HEAD', heads, np.int32)
+        save_array(tmp_path, 'ncols', ncols, np.uint8)
+        save_array(tmp_path, 'token_offsets', token_offsets, np.int64)
+        save_array(tmp_path, 'sent_id', sent_ids, np.int32)
+        save_array(tmp_path, 'full_text', full_texts, np.int32)
+        save_array(tmp_path, 'doc_rank', doc_ranks, np.int32)
+        save_array(tmp_path, 'sent_rank', sent_ranks, np.int32)
+        save_array(
+            tmp_path, 'doc_id', [strings(d) for d in doc_ids], np.int32
+        )
+        strings.save(tmp_path)
+
+        write_meta(tmp_path, {
+            'version': FORMAT_VERSION,
+            'sentences': len(sent_ids),
+            'tokens': len(heads),
+            'documents': len(doc_ids),
+            'strings': len(strings.strings)
+            })
+
+
+class BinaryCorpus(MemoryMapped, Dataset):
+    """
+    Read-only dataset backed by a binary corpus directory.
+
+    It can be used instead of a ConlluDataset; sentences are
+    made from the memory-mapped arrays when they are requested:
+        sent = corpus[10]
+        sent = corpus['sent_id']
+        for sent in corpus
+
+    NOTE: every access makes a new Sentence, changes to it are not stored.
+
+    properties:
+        doc_lengths  dict of number of sentences per doc,
+                     indexed by Sentence.doc_id
+    """
+    def __init__(self, path):
+        self.path = path
+        self.meta = read_meta(path, FORMAT_VERSION, 'corpus')
+
+        def load(name):
+            return load_array(path, name)
+
+        self._strings = load('strings')
+        self._string_offsets = load('string_offsets')
+        self._columns = {field: load(field) for field in TEXT_FIELDS}
+        self._heads = load('HEAD')
+        self._ncols = load('ncols')
+        self._token_offsets = load('token_offsets')
+        self._sent_ids = load('sent_id')
+        self._full_texts = load('full_text')
+        self._doc_ranks = load('doc_rank')
+        self._sent_ranks = load('sent_rank')
+        self._doc_ids = load('doc_id')
+
+        self._doc_id_strings = [self._decode(i) for i in self._doc_ids]
+        self.doc_lengths = OrderedDict(zip(
+            self._doc_id_strings,
+            np.bincount(
+                self._doc_ranks, minlength=len(self._doc_ids)
+            ).tolist()
+        ))
+
+        self._id_to_index = None  # maps sentence.sent_id to int index
+
+        # labels and frequent words are decoded only once
+        self.string = functools.lru_cache(maxsize=STRING_CACHE_SIZE)(
+            self._decode
+        )
+
+    def __len__(self):
+        return len(self._sent_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            index = self.index(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Sentence index out of range')
+        return next(self._make_sentences(index, index + 1, self.string))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sentence_lengths(self):
+        """The number of tokens of each sentence."""
+        return np.diff(self._token_offsets).tolist()
+
+    def index(self, ID):
+        if self._id_to_index is None:
+            self._id_to_index = {
+                self.string(s): i for i, s in enumerate(self._sent_ids)
+            }
+        return self._id_to_index[ID]
+
+    def _make_sentences(self, first, last, string):
+        """
+        Make the sentences first, .., last - 1.
+
+        Arguments:
+            string:  function from an index in the string table to the
+                     string, with -1 mapping to None
+        """
+        t0, t1 = self._token_offsets[first], self._token_offsets[last]
+        columns = {
+            field: [string(i) for i in self._columns[field][t0:t1].tolist()]
+            for field in TEXT_FIELDS
+        }
+        columns['HEAD'] = [
+            '_' if h == -1 else str(h) for h in self._heads[t0:t1].tolist()
+        ]
+        rows = list(zip(*[columns[field] for field in [
+            'ID', 'FORM', 'LEMMA', 'UPOS', 'XPOS', 'FEATS', 'HEAD', 'DEPREL',
+            'DEPS', 'MISC', 'FRAME', 'ROLE', 'COREF'
+        ]]))
+        ncols = self._ncols[t0:t1].tolist()
+        offsets = (self._token_offsets[first:last + 1] - t0).tolist()
+
+        for i in range(last - first):
+            index = first + i
+            sentence = Sentence(
+                sent_id=string(self._sent_ids[index]),
+                full_text=string(self._full_texts[index])
+            )
+            doc_rank = int(self._doc_ranks[index])
+            sentence.doc_id = self._doc_id_strings[doc_rank]
+            sentence.doc_rank = doc_rank
+            sentence.sent_rank = int(self._sent_ranks[index])
+            sentence.dataset = self
+
+            for t in range(offsets[i], offsets[i + 1]):
+                sentence.tokens.append(Token(rows[t][:ncols[t]]))
+
+            yield sentence
+
+    def _decode(self, idx):
+        if idx < 0:
+            return None
+        start, end = self._string_offsets[idx:idx + 2]
+        return self._strings[start:end].tobytes().decode('utf-8')
+
+    def to_dataset(self):
+        """Read the full corpus into a ConlluDataset."""
+        # decode each string only once; add None as last item, for index -1
+        offsets = self._string_offsets.tolist()
+        blob = self._strings.tobytes()
+        strings = [
+            blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+            for i in range(len(offsets) - 1)
+        ]
+        strings.append(None)
+
+        # make the sentences in chunks, to limit the size of temporary lists
+        dataset = ConlluDataset()
+        for first in range(0, len(self), CHUNK_SIZE):
+            last = min(first + CHUNK_SIZE, len(self))
+            dataset.extend(
+                self._make_sentences(first, last, strings.__getitem__)
+            )
+        return dataset
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+
+    write_binary(ConlluStream(args.input), args.output)
@@ -42,6 +42,10 @@ def download_srl_model(datapath='models', name_model=None, name_fasttext=None):
     if name_fasttext:
         # explicitly named fasttext
         fname_fasttext = datapath / name_fasttext
+    elif (datapath / 'fasttext.vectors').exists():
+        # exported vector table, see stroll.vectors
+        fname_fasttext = datapath / 'fasttext.vectors'
+        logger.info('fasttext.vectors found')
     else:
         # default fasttext
         fname_fasttext = datapath / 'fasttext.model.bin'
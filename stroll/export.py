@@ -0,0 +1,170 @@
+"""
+Export a trained model as a TorchScript inference artifact.
+
+Loading srl.pt needs the pickled training hyperparameters, and rebuilds
+Net in python. The exported artifact is:
+  <name>.pt     the scripted Net, run with torch.jit.load
+  <name>.json   metadata: features, dimensions, and the label classes
+
+Export the default model with:
+  python -m stroll.export --path models
+
+and use it with:
+  python -m stroll.srl --model srl.script.pt --dataset example.conll
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import torch
+
+from .labels import frame_codec, role_codec, get_dims_for_features
+from .model import Net, quantize_net
+
+
+EXPORT_VERSION = 1
+
+parser = argparse.ArgumentParser(
+    description='Export a trained SRL model as a TorchScript artifact'
+)
+parser.add_argument(
+    '--path',
+    default='models',
+    help='Path to the models directory'
+)
+parser.add_argument(
+    '--model',
+    default='srl.pt',
+    help='Model to export, in the models directory'
+)
+parser.add_argument(
+    '--output',
+    default='srl.script.pt',
+    help='Name of the exported model, in the models directory'
+)
+parser.add_argument(
+    '--quantize',
+    default=False,
+    action='store_true',
+    help='Export the model with dynamic int8 quantization'
+)
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+
+
+def metadata_filename(filename):
+    return os.path.splitext(filename)[0] + '.json'
+
+
+def is_exported(filename):
+    """True if the model file is an exported artifact."""
+    return os.path.exists(metadata_filename(filename))
+
+
+def export_model(net, features, filename):
+    """
+    Script a Net, and save it with its metadata.
+
+    Arguments:
+        net:       the trained Net
+        features:  list of str, the features the net was trained on
+        filename:  output file, the metadata is written next to it
+    """
+    if net.label_feats is not None:
+        raise ValueError('Export the net with one-hot input, not index input')
+    net.eval()
+    scripted = torch.jit.script(net)
+    scripted.save(filename)
+
+    meta = {
+        'version': EXPORT_VERSION,
+        'features': list(features),
+        'in_feats': net.in_feats,
+        'wvec_dims': net.in_feats - get_dims_for_features(features),
+        'h_dims': net.h_dims,
+        'h_layers': net.h_layers,
+        'frames': [str(c) for c in frame_codec.classes_],
+        'roles': [str(c) for c in role_codec.classes_]
+        }
+    with open(metadata_filename(filename), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+class ExportedNet():
+    """
+    Run an exported model, with the labelling interface of Net.
+
+    properties:
+        features:  list of str, the features the net was trained on
+        in_feats:  int, dimension of the node features
+        meta:      dict, the metadata of the export
+    """
+    def __init__(self, filename):
+        with open(metadata_filename(filename), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != EXPORT_VERSION:
+            raise ValueError('Unsupported export version {} in {}'.format(
+                self.meta['version'], filename
+            ))
+
+        self.features = self.meta['features']
+        self.in_feats = self.meta['in_feats']
+        self.frames = np.array(self.meta['frames'])
+        self.roles = np.array(self.meta['roles'])
+
+        self.module = torch.jit.load(filename)
+        self.module.eval()
+
+    def eval(self):
+        return self
+
+    def __call__(self, g):
+        src, dst = g.edges()
+        return self.module.logits(
+            g.ndata['v'], src, dst, g.edata['rel_type'], g.edata['norm']
+        )
+
+    def label_indices(self, gs):
+        logitsf, logitsr = self(gs)
+        logitsf = torch.softmax(logitsf, dim=1)
+        logitsr = torch.softmax(logitsr, dim=1)
+
+        frame_chance, frame_labels = torch.max(logitsf, dim=1)
+        role_chance, role_labels = torch.max(logitsr, dim=1)
+        return frame_labels, role_labels, frame_chance, role_chance
+
+    def label(self, gs):
+        frame_labels, role_labels, \
+            frame_chance, role_chance = self.label_indices(gs)
+        frame_labels = self.frames[frame_labels.numpy()]
+        role_labels = self.roles[role_labels.numpy()]
+        return frame_labels, role_labels, frame_chance, role_chance
+
+
+if __name__ == '__main__':
+    logger.setLevel(logging.INFO)
+    args = parser.parse_args()
+
+    state_dict = torch.load(os.path.join(args.path, args.model))
+    hyperparams = state_dict.pop('hyperparams')
+
+    net = Net(
+        in_feats=state_dict['embedding.fc.0.weight'].shape[1],
+        h_layers=hyperparams.h_layers,
+        h_dims=hyperparams.h_dims,
+        out_feats_a=2,
+        out_feats_b=19,
+        activation='relu'
+    )
+    net.load_state_dict(state_dict)
+    net = net.optimize_for_inference()
+    if args.quantize:
+        net = quantize_net(net)
+
+    output = os.path.join(args.path, args.output)
+    logger.info('Exporting {} to {}'.format(args.model, output))
+    export_model(net, hyperparams.features, output)
@@ -1,8 +1,12 @@
+import os
+import numpy as np
 import torch
-import dgl
 
-from torch.utils.data import Dataset
-from .conllu import ConlluDataset
+from collections import OrderedDict
+from torch.utils.data import Dataset, IterableDataset, Sampler, \
+        get_worker_info
+from .conllu import ConlluDataset, ConlluStream, LazyConlluDataset
+from .corpus import BinaryCorpus
 
 from .labels import upos_codec, xpos_codec, deprel_codec, feats_codec, get_dims_for_features
 
@@ -10,20 +14,50 @@ RELATION_TYPE_SELF = torch.tensor([0])
 RELATION_TYPE_HEAD = torch.tensor([1])
 RELATION_TYPE_CHILD = torch.tensor([2])
 
+# how graphs are represented: DGLGraph, or TreeBatch, which needs no DGL
+BACKENDS = ['dgl', 'torch']
+
+# the node features: one-hot 'v', or label indices 'labels' with 'wvec'
+INPUT_ARRAYS = ['v', 'labels', 'wvec']
+
 
 class GraphDataset(Dataset):
     def __init__(self,
                  filename=None,
                  features=['UPOS'],
                  sentence_encoder=None,
-                 dataset=None
+                 dataset=None,
+                 lazy=False,
+                 cache_dir=None,
+                 precompute=False,
+                 backend='dgl',
+                 index_input=False
                  ):
 
-        if filename:
-            self.dataset = ConlluDataset(filename)
-        elif dataset:
-            # make a graph dataset from the conllu dataset
+        if backend not in BACKENDS:
+            raise ValueError('Unknown graph backend {}'.format(backend))
+        self.backend = backend
+
+        # node data 'labels' and 'wvec' instead of 'v', see graph_arrays
+        if index_input and (cache_dir or precompute):
+            raise ValueError(
+                    'index_input is not supported with a graph cache, '
+                    'or precomputed graphs'
+                    )
+        self.index_input = index_input
+
+        if dataset:
+            # make a graph dataset from the conllu dataset,
+            # the filename, if given, is only used for the cache
             self.dataset = dataset
+        elif filename and os.path.isdir(filename):
+            # a corpus in binary format, see stroll.corpus
+            self.dataset = BinaryCorpus(filename)
+        elif filename and lazy:
+            # read sentences from disk when needed, using an offset index
+            self.dataset = LazyConlluDataset(filename)
+        elif filename:
+            self.dataset = ConlluDataset(filename)
 
         self.sentence_encoder = sentence_encoder
 
@@ -46,75 +80,587 @@ class GraphDataset(Dataset):
         if 'WVEC' in features:
             self.in_feats = self.in_feats + self.sentence_encoder.dims
 
+        # encoded graphs stored on disk, see stroll.cache
+        self.cache = None
+        if cache_dir:
+            if not filename:
+                raise ValueError('A graph cache needs the input filename')
+            from .cache import open_graph_cache
+            self.cache = open_graph_cache(
+                    cache_dir,
+                    filename,
+                    self.dataset,
+                    self.features,
+                    self.sentence_encoder
+                    )
+
+        # all graphs encoded once, in shared memory
+        self.packed = None
+        if precompute:
+            self.packed = _PackedGraphs(
+                    self._graph_arrays(i) for i in range(len(self.dataset))
+                    )
+
+    def _graph_arrays(self, index):
+        if self.cache is not None:
+            return self.cache[index]
+        return graph_arrays(
+                self.dataset[index],
+                self.features,
+                self.sentence_encoder
+                )
+
     def __len__(self):
-        return len(self.dataset.sentences)
+        return len(self.dataset)
 
     def __iter__(self):
-        for i in range(len(self.dataset.sentences)):
+        for i in range(len(self.dataset)):
             yield self.dataset[i]
 
+    def sentence_lengths(self):
+        """The number of nodes in the graph of each sentence."""
+        if self.packed is not None:
+            offsets = self.packed.node_offsets
+            return (offsets[1:] - offsets[:-1]).tolist()
+        if isinstance(self.dataset, BinaryCorpus):
+            return self.dataset.sentence_lengths()
+        return [len(sentence) for sentence in self.dataset]
+
     def conllu(self, index):
-        if isinstance(index, dgl.DGLGraph):
+        if hasattr(index, 'ndata'):
             index = index.ndata['sent_index'][0].item()
         return self.dataset[index]
 
     def __getitem__(self, index):
-        g = dgl.DGLGraph()
+        if self.packed is not None:
+            return graph_from_arrays(self.packed[index], index, self.backend)
+        if self.cache is not None:
+            return graph_from_arrays(self.cache[index], index, self.backend)
 
-        g.sentence = self.dataset[index]
-        sentence = g.sentence.encode(
-                sentence_encoder=self.sentence_encoder
+        return make_graph(
+                self.dataset[index],
+                index,
+                self.features,
+                self.sentence_encoder,
+                self.backend,
+                self.index_input
                 )
 
-        # add nodes
-        for token in sentence:
-            g.add_nodes(1, {
-                'v': torch.cat(
-                    [token[f] for f in self.features],
-                    0).view(1, -1),
-                'frame': token.FRAME,
-                'role': token.ROLE,
-                'sent_index': torch.tensor([index], dtype=torch.int32),
-                'token_index': torch.tensor(
-                    [sentence.index(token.ID)],
-                    dtype=torch.int32
+
+class _PackedGraphs():
+    """
+    The arrays of many graphs, concatenated into a few contiguous tensors.
+
+    Indexing gives the arrays of a graph, as slices, in the format of
+    graph_arrays. The tensors are moved to shared memory, so DataLoader
+    workers use them without making a copy.
+    """
+    # number of graphs to concatenate at once, while packing
+    CHUNK_SIZE = 1000
+
+    NODE_ARRAYS = ['v', 'frame', 'role']
+    EDGE_ARRAYS = {
+        'src': torch.int32, 'dst': torch.int32, 'rel_type': torch.int8,
+        'norm': torch.float32
+        }
+
+    def __init__(self, graphs):
+        """
+        Arguments:
+            graphs:  iterable of dict of tensors, see graph_arrays
+        """
+        names = self.NODE_ARRAYS + list(self.EDGE_ARRAYS)
+        chunks = {name: [] for name in names}
+        nodes = [0]
+        edges = [0]
+
+        # concatenate per chunk, so the many small tensors are freed early
+        chunk = []
+        for arrays in graphs:
+            chunk.append(arrays)
+            nodes.append(nodes[-1] + len(arrays['frame']))
+            edges.append(edges[-1] + len(arrays['src']))
+            if len(chunk) == self.CHUNK_SIZE:
+                self._add_chunk(chunks, chunk)
+                chunk = []
+        self._add_chunk(chunks, chunk)
+
+        # copy the chunks into tensors that are allocated in shared memory,
+        # moving a tensor there afterwards would take another copy
+        self.tensors = {}
+        for name in names:
+            if not chunks[name]:
+                # an empty dataset
+                self.tensors[name] = torch.zeros(0)
+                continue
+            first = chunks[name][0]
+            shape = [sum(len(c) for c in chunks[name])] + list(first.shape[1:])
+            tensor = torch.empty(shape, dtype=first.dtype).share_memory_()
+            torch.cat(chunks[name], out=tensor)
+            self.tensors[name] = tensor
+            chunks[name] = None
+        self.node_offsets = torch.tensor(nodes, dtype=torch.int64)
+        self.edge_offsets = torch.tensor(edges, dtype=torch.int64)
+
+    def _add_chunk(self, chunks, chunk):
+        if not chunk:
+            return
+        for name in self.NODE_ARRAYS:
+            chunks[name].append(torch.cat([a[name] for a in chunk]))
+        for name, dtype in self.EDGE_ARRAYS.items():
+            chunks[name].append(torch.cat([a[name] for a in chunk]).to(dtype))
+
+    def __len__(self):
+        return len(self.node_offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        n0, n1 = self.node_offsets[index:index + 2].tolist()
+        e0, e1 = self.edge_offsets[index:index + 2].tolist()
+
+        result = {name: self.tensors[name][n0:n1] for name in self.NODE_ARRAYS}
+        for name in self.EDGE_ARRAYS:
+            result[name] = self.tensors[name][e0:e1]
+        for name in ['src', 'dst', 'rel_type']:
+            result[name] = result[name].long()
+        return result
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batch sentences of similar length, up to a maximum number of tokens.
+
+    Every epoch, the sentences are sorted by length, with ties in random
+    order, and cut into batches of at most max_tokens nodes in total;
+    then the order of the batches is shuffled. A sentence longer than
+    max_tokens gets a batch of its own.
+
+    Use it as the batch_sampler of a DataLoader:
+        sampler = BucketBatchSampler(dataset.sentence_lengths(), 2000)
+        loader = DataLoader(dataset, batch_sampler=sampler, ..)
+    """
+    def __init__(self, lengths, max_tokens, shuffle=True, generator=None):
+        """
+        Arguments:
+            lengths:     list of int, the number of nodes per sentence
+            max_tokens:  int, the maximum number of nodes per batch
+            shuffle:     bool, shuffle the order of the batches and of
+                         sentences of equal length
+            generator:   optional torch.Generator, for reproducible batches
+        """
+        self.lengths = torch.as_tensor(lengths, dtype=torch.int64)
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.generator = generator
+
+        # the batch sizes only depend on the lengths, not on the order
+        # of sentences with equal length
+        self._num_batches = len(self._make_batches(self._sorted(False)))
+
+    def _sorted(self, shuffle):
+        if shuffle:
+            order = torch.randperm(len(self.lengths), generator=self.generator)
+        else:
+            order = torch.arange(len(self.lengths))
+        by_length = torch.sort(self.lengths[order], stable=True).indices
+        return order[by_length].tolist()
+
+    def _make_batches(self, indices):
+        batches = []
+        batch = []
+        tokens = 0
+        lengths = self.lengths.tolist()
+        for index in indices:
+            if batch and tokens + lengths[index] > self.max_tokens:
+                batches.append(batch)
+                batch = []
+                tokens = 0
+            batch.append(index)
+            tokens += lengths[index]
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def __iter__(self):
+        batches = self._make_batches(self._sorted(self.shuffle))
+        if self.shuffle:
+            order = torch.randperm(len(batches), generator=self.generator)
+            batches = [batches[i] for i in order.tolist()]
+        for batch in batches:
+            yield batch
+
+    def __len__(self):
+        return self._num_batches
+
+
+class GraphStream(IterableDataset):
+    """
+    Stream graphs from a ConlluStream, without loading the full dataset.
+
+    The graphs are yielded in file order. When iterated in the main process
+    (DataLoader with num_workers=0) the most recent sentences are kept,
+    so they can be looked up again with conllu(); with multiple workers,
+    the stream is split over the workers, and conllu() is not available.
+    """
+    def __init__(self,
+                 filename=None,
+                 features=['UPOS'],
+                 sentence_encoder=None,
+                 dataset=None,
+                 window=1000,
+                 backend='dgl',
+                 index_input=False
+                 ):
+
+        if backend not in BACKENDS:
+            raise ValueError('Unknown graph backend {}'.format(backend))
+        self.backend = backend
+        self.index_input = index_input
+
+        if filename:
+            self.dataset = ConlluStream(filename)
+        elif dataset:
+            self.dataset = dataset
+
+        self.sentence_encoder = sentence_encoder
+        self.features = features
+
+        self.in_feats = get_dims_for_features(features)
+        if 'WVEC' in features:
+            self.in_feats += self.sentence_encoder.dims
+
+        # sentences yielded, but not yet retrieved via conllu()
+        self.window = window
+        self._sentences = OrderedDict()
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        self._sentences = OrderedDict()
+
+        for index, sentence in enumerate(self.dataset):
+            if worker_info is not None:
+                if index % worker_info.num_workers != worker_info.id:
+                    continue
+            else:
+                self._sentences[index] = sentence
+                if len(self._sentences) > self.window:
+                    self._sentences.popitem(last=False)
+
+            yield make_graph(
+                    sentence,
+                    index,
+                    self.features,
+                    self.sentence_encoder,
+                    self.backend,
+                    self.index_input
                     )
-                })
-
-        # add edges: word -> head
-        for token in sentence:
-            if token.HEAD != '0' and token.HEAD != '_':
-                g.add_edges(
-                        sentence.index(token.ID),
-                        sentence.index(token.HEAD),
-                        {'rel_type': RELATION_TYPE_HEAD}
+
+    def conllu(self, index):
+        if hasattr(index, 'ndata'):
+            index = index.ndata['sent_index'][0].item()
+        if index not in self._sentences:
+            raise KeyError(
+                    'Sentence {} is not in the window of the last {} '
+                    'sentences; the window must hold at least a batch, '
+                    'and conllu() needs num_workers=0'.format(
+                        index, self.window
                         )
+                    )
+        return self._sentences.pop(index)
+
+
+def make_graph(conllu_sentence, index, features, sentence_encoder=None,
+               backend='dgl', index_input=False):
+    """
+    Build the graph for a sentence.
+
+    Arguments:
+        conllu_sentence:   the Sentence to convert
+        index:             int, the index of the sentence in its dataset
+        features:          list of str, the features to use as node data 'v'
+        sentence_encoder:  optional sentence encoder for the WVEC feature
+        backend:           'dgl' for a DGLGraph, 'torch' for a TreeBatch
+        index_input:       encode the labels as indices, see graph_arrays
+    """
+    g = graph_from_arrays(
+            graph_arrays(
+                conllu_sentence, features, sentence_encoder, index_input
+                ),
+            index,
+            backend
+            )
+    g.sentence = conllu_sentence
+    return g
+
+
+def tree_edges(tree):
+    """
+    The edges of the graph of a dependency tree.
+
+    Per word with a head, an edge word -> head, with 1/(3 * number of
+    children of the head) as a weight factor; then per token a self edge,
+    and for a word with a head the reversed dependency head -> word,
+    with a weight of 1/3.
+
+    Arguments:
+        tree:  DependencyTree, see Sentence.tree
+
+    Returns:
+        lists [edges], src, dst, rel_type, and norm
+    """
+    heads = tree.heads.tolist()
+    words = [i for i, head in enumerate(heads) if head >= 0]
+
+    # edges: word -> head
+    src = list(words)
+    dst = [heads[i] for i in words]
+    rel_type = [RELATION_TYPE_HEAD.item()] * len(words)
+    norm = [1.0 / (3.0 * len(tree.children[head])) for head in dst]
+
+    # edges: word -> word (self edge), and head -> word (reversed
+    # dependency), per token; they get a weight of 1/3
+    for i, head in enumerate(heads):
+        src.append(i)
+        dst.append(i)
+        rel_type.append(RELATION_TYPE_SELF.item())
+        norm.append(1.0 / 3.0)
+        if head >= 0:
+            src.append(head)
+            dst.append(i)
+            rel_type.append(RELATION_TYPE_CHILD.item())
+            norm.append(1.0 / 3.0)
+    return src, dst, rel_type, norm
+
+
+def graph_arrays(conllu_sentence, features, sentence_encoder=None,
+                 index_input=False):
+    """
+    Encode a sentence into the node and edge data of its graph.
+
+    With index_input, the node features are not a one-hot encoding 'v',
+    but the indices of the labels of each token, 'labels', and the word
+    vectors, 'wvec'; see Sentence.encode_indices.
+
+    Returns:
+        dict of tensors, with per node 'v' (or 'labels' and 'wvec'),
+        'frame', 'role', and per edge 'src', 'dst', 'rel_type', 'norm'
+    """
+    sentence = conllu_sentence
+    src, dst, rel_type, norm = tree_edges(sentence.tree)
+
+    if index_input:
+        labels, wvec, frame, role = sentence.encode_indices(
+                features,
+                sentence_encoder=sentence_encoder
+                )
+        arrays = {'labels': labels, 'wvec': wvec}
+    else:
+        v, frame, role = sentence.encode_batch(
+                features,
+                sentence_encoder=sentence_encoder
+                )
+        arrays = {'v': v}
+
+    arrays.update({
+        'frame': frame,
+        'role': role,
+        'src': torch.tensor(src, dtype=torch.int64),
+        'dst': torch.tensor(dst, dtype=torch.int64),
+        'rel_type': torch.tensor(rel_type, dtype=torch.int64),
+        'norm': torch.tensor(norm, dtype=torch.float32)
+        })
+    return arrays
+
+
+def graph_from_arrays(arrays, index, backend='dgl'):
+    """
+    Build a graph from the output of graph_arrays.
+
+    Arguments:
+        arrays:   dict of tensors, see graph_arrays
+        index:    int, the index of the sentence in its dataset
+        backend:  'dgl' for a DGLGraph, 'torch' for a TreeBatch
+    """
+    n = len(arrays['frame'])
+    ndata = {
+        name: arrays[name] for name in INPUT_ARRAYS if name in arrays
+        }
+    ndata.update({
+        'frame': arrays['frame'],
+        'role': arrays['role'],
+        'sent_index': torch.full([n], index, dtype=torch.int32),
+        'token_index': torch.arange(n, dtype=torch.int32)
+        })
+    edata = {
+        'rel_type': arrays['rel_type'],
+        'norm': arrays['norm']
+        }
+
+    if backend == 'torch':
+        return TreeBatch(arrays['src'], arrays['dst'], ndata, edata)
+
+    import dgl
+    g = dgl.graph((arrays['src'], arrays['dst']), num_nodes=n)
+    g.ndata.update(ndata)
+    g.edata.update(edata)
+    return g
+
 
-        # add 1/(3 * in_degree) as a weight factor
-        for token in sentence:
-            in_edges = g.in_edges(sentence.index(token.ID), form='eid')
-            if len(in_edges):
-                norm = torch.ones([len(in_edges)]) * \
-                        (1.0 / (3.0 * len(in_edges)))
-                g.edges[in_edges].data['norm'] = norm
-
-        # add edges, these are self-edges, or reversed dependencies
-        # give them a weight of 1/3
-        norm = torch.tensor([1.0 / 3.0])
-        for token in sentence:
-            # word -> word (self edge)
-            g.add_edges(
-                    sentence.index(token.ID),
-                    sentence.index(token.ID),
-                    {'rel_type': RELATION_TYPE_SELF, 'norm': norm}
+class TreeBatch():
+    """
+    A (batch of) sentence graph(s) as plain tensors, to run without DGL.
+
+    It has the parts of the DGLGraph interface used by Net and predict:
+        ndata, edata, edges(), number_of_nodes(), number_of_edges(),
+        batch_num_nodes(), batch_num_edges()
+
+    properties:
+        src:    tensor [edges], source node of each edge
+        dst:    tensor [edges], destination node of each edge
+        ndata:  dict of tensors [nodes, ...]
+        edata:  dict of tensors [edges, ...]
+    """
+    def __init__(self, src, dst, ndata, edata,
+                 batch_num_nodes=None, batch_num_edges=None):
+        self.src = src
+        self.dst = dst
+        self.ndata = ndata
+        self.edata = edata
+
+        if batch_num_nodes is None:
+            batch_num_nodes = torch.tensor([len(ndata['frame'])])
+        if batch_num_edges is None:
+            batch_num_edges = torch.tensor([len(src)])
+        self._batch_num_nodes = batch_num_nodes
+        self._batch_num_edges = batch_num_edges
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def edges(self):
+        return self.src, self.dst
+
+    def number_of_nodes(self):
+        return int(self._batch_num_nodes.sum())
+
+    def number_of_edges(self):
+        return len(self.src)
+
+    def batch_num_nodes(self):
+        return self._batch_num_nodes
+
+    def batch_num_edges(self):
+        return self._batch_num_edges
+
+    @staticmethod
+    def batch(trees):
+        """Join a list of TreeBatch into one, like dgl.batch"""
+        num_nodes = torch.cat([t.batch_num_nodes() for t in trees])
+        num_edges = torch.cat([t.batch_num_edges() for t in trees])
+
+        # number the nodes of each tree after those of the previous trees
+        src = []
+        dst = []
+        offset = 0
+        for t in trees:
+            src.append(t.src + offset)
+            dst.append(t.dst + offset)
+            offset += t.number_of_nodes()
+
+        ndata = {
+            k: torch.cat([t.ndata[k] for t in trees]) for k in trees[0].ndata
+            }
+        edata = {
+            k: torch.cat([t.edata[k] for t in trees]) for k in trees[0].edata
+            }
+        return TreeBatch(
+                torch.cat(src), torch.cat(dst), ndata, edata,
+                num_nodes, num_edges
+                )
+
+    def unbatch(self):
+        """Split into a TreeBatch per sentence, like dgl.unbatch"""
+        node_counts = self._batch_num_nodes.tolist()
+        edge_counts = self._batch_num_edges.tolist()
+        ndata = {
+            k: torch.split(v, node_counts) for k, v in self.ndata.items()
+            }
+        edata = {
+            k: torch.split(v, edge_counts) for k, v in self.edata.items()
+            }
+        src = torch.split(self.src, edge_counts)
+        dst = torch.split(self.dst, edge_counts)
+
+        trees = []
+        offset = 0
+        for i, (n, e) in enumerate(zip(node_counts, edge_counts)):
+            trees.append(TreeBatch(
+                src[i] - offset,
+                dst[i] - offset,
+                {k: v[i] for k, v in ndata.items()},
+                {k: v[i] for k, v in edata.items()},
+                torch.tensor([n]),
+                torch.tensor([e])
+                ))
+            offset += n
+        return trees
+
+
+def pad_labels(graphs):
+    """
+    Pad the node data 'labels' of the graphs with zeros to equal width.
+
+    With index_input, each sentence has as many label columns as its
+    token with the most labels; to batch graphs these should be equal.
+    """
+    if 'labels' not in graphs[0].ndata:
+        return
+    width = max(g.ndata['labels'].shape[1] for g in graphs)
+    for g in graphs:
+        labels = g.ndata['labels']
+        if labels.shape[1] < width:
+            g.ndata['labels'] = torch.nn.functional.pad(
+                    labels, (0, width - labels.shape[1])
                     )
 
-            # TODO: tokens with ID's like '38.1' don't have a head.
-            if token.HEAD != '0' and token.HEAD != '_':
-                # head -> word
-                g.add_edges(
-                        sentence.index(token.HEAD),
-                        sentence.index(token.ID),
-                        {'rel_type': RELATION_TYPE_CHILD, 'norm': norm}
-                        )
-        return g
+
+def batch_graphs(graphs):
+    """
+    Batch a list of graphs, DGLGraph or TreeBatch; use as collate_fn.
+    """
+    pad_labels(graphs)
+    if isinstance(graphs[0], TreeBatch):
+        return TreeBatch.batch(graphs)
+
+    import dgl
+    return dgl.batch(graphs)
+
+
+def unbatch_graphs(batch):
+    """Split a batch made by batch_graphs into its graphs."""
+    if isinstance(batch, TreeBatch):
+        return batch.unbatch()
+
+    import dgl
+    return dgl.unbatch(batch)
+
+
+def split_batch(gs, *arrays):
+    """
+    Split per node arrays of a batch of graphs into arrays per graph.
+
+    Arguments:
+        gs:      batched graphs, see batch_graphs
+        arrays:  numpy arrays [nodes, ...]
+
+    Yields:
+        per graph, the index of its sentence, and its slice of each array
+    """
+    num_nodes = gs.batch_num_nodes().numpy()
+    starts = np.cumsum(num_nodes) - num_nodes
+    sent_index = gs.ndata['sent_index'].numpy()[starts].tolist()
+
+    splits = [np.split(array, starts[1:]) for array in arrays]
+    for i, index in enumerate(sent_index):
+        yield (index, ) + tuple(split[i] for split in splits)
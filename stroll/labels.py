@@ -1,4 +1,8 @@
+import functools
+import os
+import numpy as np
 import torch
+from torch.utils.data import get_worker_info
 from sklearn.preprocessing import LabelEncoder
 import fasttext
 
@@ -108,32 +112,175 @@ frame_codec = LabelEncoder().fit(FRAMES)
 role_codec = LabelEncoder().fit(ROLES)
 
 
+class LabelIndex:
+    """
+    A dictionary based lookup for the labels of a fitted LabelEncoder.
+
+    It gives the same indices as codec.transform, but without the overhead
+    of sklearn and numpy per call, so it can be used per token.
+    """
+    def __init__(self, codec, ignore_unknown=False):
+        self.codec = codec
+        self.classes_ = codec.classes_
+        self.index = {label: i for i, label in enumerate(codec.classes_)}
+        self.ignore_unknown = ignore_unknown
+
+    def __len__(self):
+        return len(self.classes_)
+
+    def transform(self, labels):
+        """
+        Return the list of indices for the labels.
+
+        Unknown labels are skipped when ignore_unknown is set, otherwise
+        they raise a ValueError, like the LabelEncoder.
+        """
+        index = self.index
+        if self.ignore_unknown:
+            return [index[label] for label in labels if label in index]
+        try:
+            return [index[label] for label in labels]
+        except KeyError as e:
+            raise ValueError(
+                'y contains previously unseen labels: {}'.format(e.args[0])
+            )
+
+
+upos_index = LabelIndex(upos_codec)
+xpos_index = LabelIndex(xpos_codec)
+deprel_index = LabelIndex(deprel_codec)
+feats_index = LabelIndex(feats_codec, ignore_unknown=True)
+frame_index = LabelIndex(frame_codec)
+role_index = LabelIndex(role_codec)
+
+# LabelIndex per codec, used by to_one_hot and to_index
+_LABEL_INDICES = {
+    index.codec: index for index in [
+        upos_index, xpos_index, deprel_index, feats_index, frame_index,
+        role_index
+    ]
+}
+
+
+def _transform(codec, values):
+    if codec in _LABEL_INDICES and not isinstance(values, torch.Tensor):
+        return _LABEL_INDICES[codec].transform(values)
+    return codec.transform(values)
+
+
 def to_one_hot(codec, values):
     if isinstance(values, (type([]), torch.Tensor)):
-        value_idxs = codec.transform(values)
-        return torch.eye(len(codec.classes_))[value_idxs].sum(axis=0)
+        value_idxs = _transform(codec, values)
+        one_hot = torch.zeros(len(codec.classes_))
+        for i in value_idxs:
+            one_hot[i] += 1.
+        return one_hot
     else:
-        value_idxs = codec.transform([values])
-        return torch.eye(len(codec.classes_))[value_idxs].flatten()
+        value_idxs = _transform(codec, [values])
+        one_hot = torch.zeros(len(codec.classes_))
+        one_hot[value_idxs] = 1.
+        return one_hot
 
 
 def to_index(codec, values):
-    return torch.tensor(codec.transform([values])).flatten()
+    return torch.tensor(_transform(codec, [values]), dtype=torch.int64)
+
+
+# number of word vectors kept by a FasttextEncoder
+WORD_CACHE_SIZE = 100000
 
 
 class FasttextEncoder:
-    """Use Fasttext word vectors per word"""
-    def __init__(self, filename):
-        self.model = fasttext.load_model(filename)
+    """
+    Use Fasttext word vectors per word.
+
+    The vectors of the most recently used words are cached, so frequent
+    words (and the subword hashing of unknown words) are computed once.
+
+    The filename is a fasttext model (.bin), or a directory with a vector
+    table exported from one by stroll.vectors, which is memory-mapped.
+    """
+    def __init__(self, filename, cache_size=WORD_CACHE_SIZE):
+        if os.path.isdir(filename):
+            from .vectors import VectorTable
+            self.model = VectorTable(filename)
+        else:
+            self.model = fasttext.load_model(filename)
         self.dims = self.model.get_dimension()
         self.name = 'FT{}'.format(self.dims)
 
+        self.lookup = functools.lru_cache(maxsize=cache_size)(
+            self.model.get_word_vector
+        )
+
+        # hits, misses, and cached words per process, see share_statistics
+        self.shared_statistics = None
+
+        # tells models apart, ie. for the graph cache
+        stat = os.stat(filename)
+        self.identity = '{}:{}:{}:{}'.format(
+            self.name, os.path.abspath(filename), stat.st_size,
+            stat.st_mtime_ns
+        )
+
     def __call__(self, sentence):
-        word_vectors = []
-        for token in sentence:
-            word_vectors.append(torch.Tensor(self.model[token.FORM]))
+        """The word vectors of a sentence, as tensor [len(sentence), dims]"""
+        return self.encode_words([token.FORM for token in sentence])
+
+    def encode_batch(self, sentences):
+        """The word vectors of all tokens of a list of sentences."""
+        return self.encode_words(
+            [token.FORM for sentence in sentences for token in sentence]
+        )
+
+    def encode_words(self, words):
+        if self.shared_statistics is not None:
+            before = self.lookup.cache_info()
+
+        vectors = np.empty([len(words), self.dims], dtype=np.float32)
+        for i, word in enumerate(words):
+            vectors[i] = self.lookup(word)
+
+        if self.shared_statistics is not None:
+            after = self.lookup.cache_info()
+            worker = get_worker_info()
+            row = self.shared_statistics.numpy()[
+                worker.id + 1 if worker else 0
+            ]
+            row[0] += after.hits - before.hits
+            row[1] += after.misses - before.misses
+            row[2] = after.currsize
+        return torch.from_numpy(vectors)
+
+    def share_statistics(self, workers):
+        """
+        Count the cache statistics of DataLoader worker processes too.
+
+        Every worker has a copy of the cache of its own; call this before
+        the workers are started, and statistics() adds up their counts.
+
+        Arguments:
+            workers:  int, the num_workers of the DataLoader
+        """
+        self.shared_statistics = torch.zeros(
+            [workers + 1, 3], dtype=torch.int64
+        ).share_memory_()
 
-        return word_vectors
+    def statistics(self):
+        """Hits and misses of the word vector cache."""
+        if self.shared_statistics is None:
+            info = self.lookup.cache_info()
+            hits, misses, words = info.hits, info.misses, info.currsize
+        else:
+            hits, misses = self.shared_statistics[:, :2].sum(0).tolist()
+            words = self.shared_statistics[:, 2].max().item()
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'words': words,
+            'hit_rate': hits / lookups if lookups else 0.
+        }
 
 
 def get_dims_for_features(features):
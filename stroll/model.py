@@ -1,10 +1,9 @@
+import copy
 import sys
 import torch
 import torch.nn as nn
 
-import dgl.function as fn
-
-from .labels import role_codec, frame_codec
+from .labels import role_codec, frame_codec, get_dims_for_features
 
 
 class Embedding(nn.Module):
@@ -51,6 +50,141 @@ class Embedding(nn.Module):
         return self.fc(x)
 
 
+class IndexEmbedding(nn.Module):
+    """EmbeddingBag + Linear -> BatchNorm -> Activation
+
+    Equal to Embedding on the one-hot encoded labels and word vectors,
+    but takes the indices of the labels (see Sentence.encode_indices):
+    the sum of the embeddings of the labels of a node is the Linear
+    layer applied to its one-hot encoding, without making it.
+
+    Without label features (ie. only WVEC), there is no EmbeddingBag,
+    and the labels input is not used.
+    """
+    def __init__(
+            self,
+            label_feats=64,
+            wvec_feats=0,
+            out_feats=64,
+            activation='relu',
+            batchnorm=True
+            ):
+        super(IndexEmbedding, self).__init__()
+        self.label_feats = label_feats
+        self.wvec_feats = wvec_feats
+        self.out_feats = out_feats
+        self.activation = activation
+        self.batchnorm = batchnorm
+
+        # initialized as the Linear layer of Embedding, and split in the
+        # label and word vector columns; index 0 is the padding
+        linear = nn.Linear(self.label_feats + self.wvec_feats, self.out_feats)
+        nn.init.kaiming_uniform_(
+                linear.weight,
+                mode='fan_in',
+                nonlinearity='relu'
+                )
+
+        if self.label_feats:
+            self.labels = nn.EmbeddingBag(
+                    self.label_feats + 1,
+                    self.out_feats,
+                    mode='sum',
+                    padding_idx=0
+                    )
+        else:
+            self.labels = None
+        if self.wvec_feats:
+            self.wvec = nn.Linear(self.wvec_feats, self.out_feats, bias=False)
+        else:
+            self.wvec = None
+        self.bias = nn.Parameter(torch.zeros(self.out_feats))
+        with torch.no_grad():
+            self._set_linear(linear, self.label_feats)
+
+        layers = []
+        if self.batchnorm:
+            layer = nn.BatchNorm1d(self.out_feats)
+            layers.append(layer)
+
+        if self.activation == 'relu':
+            layer = nn.ReLU()
+        elif self.activation == 'tanhshrink':
+            layer = nn.Tanhshrink()
+        else:
+            print('Activation function not implemented.')
+            sys.exit(-1)
+        layers.append(layer)
+
+        self.fc = nn.Sequential(*layers)
+
+    def _set_linear(self, linear, wvec_offset):
+        """Copy the weights of a Linear layer on one-hot encoded input."""
+        wvec_end = wvec_offset + self.wvec_feats
+        weight = linear.weight
+        label_weight = torch.cat(
+                [weight[:, :wvec_offset], weight[:, wvec_end:]], dim=1
+                )
+        if self.labels is not None:
+            self.labels.weight[0] = 0.
+            self.labels.weight[1:] = label_weight.t()
+        if self.wvec is not None:
+            self.wvec.weight.copy_(weight[:, wvec_offset:wvec_end])
+        self.bias.copy_(linear.bias)
+
+    @staticmethod
+    def from_embedding(embedding, label_feats, wvec_offset):
+        """
+        An IndexEmbedding equal to an Embedding.
+
+        Arguments:
+            embedding:    Embedding, on one-hot labels and word vectors
+            label_feats:  int, the number of label columns
+            wvec_offset:  int, the first word vector column; the label
+                          columns are before and after the word vectors
+        """
+        index_embedding = IndexEmbedding(
+                label_feats=label_feats,
+                wvec_feats=embedding.in_feats - label_feats,
+                out_feats=embedding.out_feats,
+                activation=embedding.activation,
+                batchnorm=embedding.batchnorm
+                )
+        with torch.no_grad():
+            index_embedding._set_linear(embedding.fc[0], wvec_offset)
+        index_embedding.fc = copy.deepcopy(
+                nn.Sequential(*list(embedding.fc)[1:])
+                )
+        return index_embedding
+
+    def fold(self):
+        """Fold the BatchNorm in eval mode into the weights and bias."""
+        if not isinstance(self.fc[0], nn.BatchNorm1d):
+            return
+        batchnorm = self.fc[0]
+        scale = 1. / torch.sqrt(batchnorm.running_var + batchnorm.eps)
+        shift = -batchnorm.running_mean * scale
+        if batchnorm.affine:
+            scale = scale * batchnorm.weight
+            shift = shift * batchnorm.weight + batchnorm.bias
+
+        with torch.no_grad():
+            if self.labels is not None:
+                self.labels.weight.mul_(scale.view(1, -1))
+            if self.wvec is not None:
+                self.wvec.weight.mul_(scale.view(-1, 1))
+            self.bias.copy_(self.bias * scale + shift)
+        self.fc = nn.Sequential(*list(self.fc)[1:])
+
+    def forward(self, labels, wvec):
+        h = self.bias
+        if self.labels is not None:
+            h = self.labels(labels) + h
+        if self.wvec is not None:
+            h = h + self.wvec(wvec)
+        return self.fc(h)
+
+
 class MLP(nn.Module):
     """[Linear -> BatchNorm -> Activation] x (n-1) -> Linear"""
     def __init__(
@@ -125,6 +259,102 @@ class MLP(nn.Module):
         return self.fc(x)
 
 
+def fold_batchnorm(linear, batchnorm, before=False):
+    """
+    A Linear layer equal to a Linear followed by a BatchNorm1d in eval mode.
+
+    Arguments:
+        linear:     nn.Linear
+        batchnorm:  nn.BatchNorm1d, using its running statistics
+        before:     the batchnorm comes before the linear layer instead
+
+    Returns:
+        nn.Linear
+    """
+    scale = 1. / torch.sqrt(batchnorm.running_var + batchnorm.eps)
+    shift = -batchnorm.running_mean * scale
+    if batchnorm.affine:
+        scale = scale * batchnorm.weight
+        shift = shift * batchnorm.weight + batchnorm.bias
+
+    weight = linear.weight
+    bias = linear.bias
+    if bias is None:
+        bias = torch.zeros(linear.out_features)
+
+    if before:
+        # W (scale * x + shift) + b
+        bias = torch.mv(weight, shift) + bias
+        weight = weight * scale.view(1, -1)
+    else:
+        # scale * (W x + b) + shift
+        bias = bias * scale + shift
+        weight = weight * scale.view(-1, 1)
+
+    folded = nn.Linear(linear.in_features, linear.out_features)
+    with torch.no_grad():
+        folded.weight.copy_(weight)
+        folded.bias.copy_(bias)
+    return folded
+
+
+def fold_sequential(sequential):
+    """Fold each Linear -> BatchNorm1d pair of an nn.Sequential."""
+    layers = []
+    for layer in sequential:
+        if isinstance(layer, nn.BatchNorm1d) and layers and \
+                isinstance(layers[-1], nn.Linear):
+            layers[-1] = fold_batchnorm(layers[-1], layer)
+        else:
+            layers.append(layer)
+    return nn.Sequential(*layers)
+
+
+def relation_messages(h, weight, src, rel_type, norm):
+    """
+    The messages norm * W_(rel_type) h_src of all edges of a graph.
+
+    Instead of gathering a weight matrix per edge, which takes
+    [edges, in_feats, out_feats] of memory, h is multiplied with the
+    weight of each relation type once, and the messages are picked from
+    the products.
+
+    Arguments:
+        h:         node states, tensor [nodes, in_feats]
+        weight:    tensor [relations, in_feats, out_feats]
+        src:       source node per edge, tensor [edges]
+        rel_type:  relation type per edge, tensor [edges]
+        norm:      weight factor per edge, tensor [edges]
+
+    Returns:
+        tensor [edges, out_feats]
+    """
+    # W_r h for all relations r and nodes: [relations * nodes, out_feats]
+    wh = torch.matmul(h.unsqueeze(0), weight).view(-1, weight.shape[2])
+
+    index = rel_type * h.shape[0] + src
+    return wh[index] * norm.view(-1, 1)
+
+
+def sum_messages(messages, dst, num_nodes: int):
+    """
+    Sum the messages of the edges at their destination nodes.
+
+    Arguments:
+        messages:   tensor [edges, feats]
+        dst:        destination node per edge, tensor [edges]
+        num_nodes:  int, number of nodes in the graph
+
+    Returns:
+        tensor [nodes, feats]
+    """
+    summed = torch.zeros(
+            [num_nodes, messages.shape[1]],
+            dtype=messages.dtype
+            )
+    return summed.index_add(0, dst, messages)
+
+
 # https://docs.dgl.ai/en/0.4.x/tutorials/models/1_gnn/4_rgcn.html
 # simplify by setting num_bases = num_rels = 3
 class RGCN(nn.Module):
@@ -167,38 +397,26 @@ class RGCN(nn.Module):
                 )
 
     def forward(self, graph):
-        weight = self.weight
+        h = graph.ndata.pop('h')
+        src, dst = graph.edges()
 
         # At each edge, multiply the state h from the source node
-        # with a linear weight W_(edge_type)
-        def rgcn_msg(edges):
-            w = weight[edges.data['rel_type']]
-            n = edges.data['norm']
-            msg = torch.bmm(edges.src['h'].unsqueeze(1), w).squeeze()
-            msg = torch.bmm(n.reshape(-1, 1, 1), msg.unsqueeze(1)).squeeze()
-
-            return {'m': msg}
-
-        # At each node, we want the summed messages W_(edge_type) \dot h
-        # from the incomming edges
-        rgcn_reduce = fn.sum(msg='m', out='Swh')
+        # with a linear weight W_(edge_type), and at each node, we want the
+        # summed messages W_(edge_type) \dot h from the incomming edges
+        messages = relation_messages(
+                h, self.weight, src, graph.edata['rel_type'],
+                graph.edata['norm']
+                )
+        Swh = sum_messages(messages, dst, graph.number_of_nodes())
 
         # Apply activation to the sum(in_edges) W_(edge_type) \dot h
         # TODO: add bias?
-        def rgcn_apply(nodes):
-            h = nodes.data.pop('h')
-            Swh = nodes.data.pop('Swh')
-
-            if self.skip:
-                h = self.batchnorm(h + Swh)
-            else:
-                h = self.batchnorm(h)
-
-            h = self.activation_(h + Swh)
-
-            return {'h': h}
+        if self.skip:
+            h = self.batchnorm(h + Swh)
+        else:
+            h = self.batchnorm(h)
 
-        graph.update_all(rgcn_msg, rgcn_reduce, rgcn_apply)
+        graph.ndata['h'] = self.activation_(h + Swh)
 
         return graph
 
@@ -242,54 +460,58 @@ class RGCNGRU(nn.Module):
                 self.in_feats, self.out_feats
                 )
 
+    @torch.jit.unused
     def forward(self, graph):
-        weight = self.weight
+        src, dst = graph.edges()
+        graph.ndata['h'] = self.propagate(
+                graph.ndata.pop('h'),
+                src,
+                dst,
+                graph.edata['rel_type'],
+                graph.edata['norm']
+                )
+        return graph
 
-        # At each edge, multiply the state h from the source node
-        # with a linear weight W_(edge_type)
-        def rgcn_msg(edges):
-            w = weight[edges.data['rel_type']]
-            n = edges.data['norm']
-            msg = torch.bmm(edges.src['output'].unsqueeze(1), w).squeeze()
-            msg = torch.bmm(n.reshape(-1, 1, 1), msg.unsqueeze(1)).squeeze()
-
-            return {'m': msg}
-
-        # At each node, we want the summed messages W_(edge_type) \dot h
-        # from the incomming edges
-        rgcn_reduce = fn.sum(msg='m', out='Swh')
-
-        # Apply GRU to the sum(in_edges) W_(edge_type) \dot h
-        def rgcn_apply(nodes):
-            # Shape of h: [len(graph), self.out_feats]
-            # GRU wants: [seq_len, batch, input_size]
-            output, h_next = self.gru(
-                    nodes.data.pop('Swh').view(1, len(graph), self.out_feats),
-                    nodes.data.pop('h').view(1, len(graph), self.out_feats)
-                    )
+    def propagate(self, h, src, dst, rel_type, norm):
+        """
+        The message passing on the tensors of a graph.
+
+        Arguments:
+            h:         embedded node features, tensor [nodes, in_feats]
+            src:       source node per edge, tensor [edges]
+            dst:       destination node per edge, tensor [edges]
+            rel_type:  relation type per edge, tensor [edges]
+            norm:      weight factor per edge, tensor [edges]
 
-            return {
-                    'h': h_next.view(len(graph), self.out_feats),
-                    'output': output.view(len(graph), self.out_feats)
-                    }
+        Returns:
+            tensor [nodes, out_feats]
+        """
+        num_nodes = h.shape[0]
 
         # the embedded node features are the first input to the GRU layer
-        graph.ndata['output'] = graph.ndata.pop('h')
+        output = h
 
         # initial hidden state of the GRU cell
-        graph.ndata['h'] = torch.zeros([len(graph), self.out_feats])
+        h = torch.zeros([1, num_nodes, self.out_feats])
 
         # each step will take the output and hidden state of t-1,
         # and create a new output and hidden state for step t
         for l in range(self.num_layers):
-            graph.update_all(rgcn_msg, rgcn_reduce, rgcn_apply)
+            # At each edge, multiply the state h from the source node
+            # with a linear weight W_(edge_type), and at each node, we want
+            # the summed messages W_(edge_type) \dot h from the incomming edges
+            messages = relation_messages(
+                    output, self.weight, src, rel_type, norm
+                    )
+            Swh = sum_messages(messages, dst, num_nodes)
 
-        # Batchnorm
-        graph.ndata.pop('h')
-        output = graph.ndata.pop('output')
-        graph.ndata['h'] = self.batchnorm(output)
+            # Apply GRU to the sum(in_edges) W_(edge_type) \dot h
+            # GRU wants: [seq_len, batch, input_size]
+            output, h = self.gru(Swh.view(1, num_nodes, self.out_feats), h)
+            output = output.view(num_nodes, self.out_feats)
 
-        return graph
+        # Batchnorm
+        return self.batchnorm(output)
 
 
 class Net(nn.Module):
@@ -300,7 +522,8 @@ class Net(nn.Module):
             h_dims=16,
             out_feats_a=2,
             out_feats_b=16,
-            activation='relu'
+            activation='relu',
+            label_feats=None
             ):
         super(Net, self).__init__()
         self.h_layers = h_layers
@@ -309,12 +532,21 @@ class Net(nn.Module):
         self.out_feats_a = out_feats_a
         self.out_feats_b = out_feats_b
         self.activation = activation
-
-        # Embedding
-        self.embedding = Embedding(
-                in_feats=self.in_feats,
-                out_feats=self.h_dims
-                )
+        self.label_feats = label_feats
+
+        # Embedding, of the one-hot node features 'v', or with label_feats
+        # of the label indices 'labels' and the word vectors 'wvec'
+        if self.label_feats is None:
+            self.embedding = Embedding(
+                    in_feats=self.in_feats,
+                    out_feats=self.h_dims
+                    )
+        else:
+            self.embedding = IndexEmbedding(
+                    label_feats=self.label_feats,
+                    wvec_feats=self.in_feats - self.label_feats,
+                    out_feats=self.h_dims
+                    )
 
         # Hidden layers, each of h_dims to h_dims
         self.kernel = RGCNGRU(
@@ -339,26 +571,176 @@ class Net(nn.Module):
         self.loss_a = torch.nn.Parameter(torch.tensor([0.]))
         self.loss_b = torch.nn.Parameter(torch.tensor([0.]))
 
+    @torch.jit.unused
     def forward(self, g):
+        src, dst = g.edges()
+        if self.label_feats is None:
+            return self.logits(
+                    g.ndata['v'], src, dst, g.edata['rel_type'],
+                    g.edata['norm']
+                    )
+
+        h = self.embedding(g.ndata['labels'], g.ndata['wvec'])
+        return self.propagate(
+                h, src, dst, g.edata['rel_type'], g.edata['norm']
+                )
+
+    @torch.jit.export
+    def logits(self, v, src, dst, rel_type, norm):
+        """
+        The frame and role logits, from the tensors of a graph.
+
+        Arguments:
+            v:         node features, tensor [nodes, in_feats]
+            src:       source node per edge, tensor [edges]
+            dst:       destination node per edge, tensor [edges]
+            rel_type:  relation type per edge, tensor [edges]
+            norm:      weight factor per edge, tensor [edges]
+
+        Returns:
+            tensors [nodes, out_feats_a] and [nodes, out_feats_b]
+        """
         # Linear transform of one-hot-encoding to internal representation
-        g.ndata['h'] = self.embedding(g.ndata['v'])
+        h = self.embedding(v)
+        return self.propagate(h, src, dst, rel_type, norm)
 
+    def propagate(self, h, src, dst, rel_type, norm):
+        """The frame and role logits, from the embedded node features."""
         # Hidden layers, each of h_dims to h_dims
-        g = self.kernel(g)
+        h = self.kernel.propagate(h, src, dst, rel_type, norm)
 
         # MLP output
-        x_a = self.task_a(g.ndata['h'])
-        x_b = self.task_b(g.ndata['h'])
+        x_a = self.task_a(h)
+        x_b = self.task_b(h)
 
         return x_a, x_b
 
-    def label(self, gs):
+    def optimize_for_inference(self):
+        """
+        A copy of the net for inference only, giving the same labels.
+
+        The BatchNorm layers are folded into the weights of the Linear
+        layers next to them: in the Embedding and MLPs the one after the
+        Linear, and the one after the kernel into the first Linear of both
+        tasks. The loss weights are removed, and the parameters are frozen.
+
+        Returns:
+            Net, in eval mode, without gradients
+        """
+        net = copy.deepcopy(self)
+        net.eval()
+
+        if isinstance(net.embedding, IndexEmbedding):
+            net.embedding.fold()
+        else:
+            net.embedding.fc = fold_sequential(net.embedding.fc)
+
+        # the kernel output goes to the first layer of both tasks
+        for task in [net.task_a, net.task_b]:
+            layers = list(task.fc)
+            layers[0] = fold_batchnorm(
+                    layers[0], net.kernel.batchnorm, before=True
+                    )
+            task.fc = fold_sequential(layers)
+        net.kernel.batchnorm = nn.Identity()
+
+        # only used for training
+        del net.loss_a
+        del net.loss_b
+
+        for parameter in net.parameters():
+            parameter.requires_grad_(False)
+        return net
+
+    def to_index_input(self, features):
+        """
+        A copy of the net taking label indices, instead of one-hot input.
+
+        The net gives the same logits for graphs made with index_input
+        (see graph_arrays) as this net for the one-hot encoded graphs;
+        use it to convert existing checkpoints.
+
+        Arguments:
+            features:  list of str, the features the net was trained on
+
+        Returns:
+            Net, with an IndexEmbedding
+        """
+        if self.label_feats is not None:
+            return copy.deepcopy(self)
+
+        label_feats = get_dims_for_features(features)
+        if 'WVEC' in features:
+            wvec_offset = get_dims_for_features(
+                    features[:features.index('WVEC')]
+                    )
+        else:
+            wvec_offset = label_feats
+
+        net = copy.deepcopy(self)
+        net.label_feats = label_feats
+        net.embedding = IndexEmbedding.from_embedding(
+                self.embedding, label_feats, wvec_offset
+                )
+        net.train(self.training)
+        return net
+
+    def label_indices(self, gs):
+        """
+        The best frame and role per node, as indices of the label classes,
+        and their chances; all tensors [nodes].
+        """
         logitsf, logitsr = self(gs)
         logitsf = torch.softmax(logitsf, dim=1)
         logitsr = torch.softmax(logitsr, dim=1)
 
         frame_chance, frame_labels = torch.max(logitsf, dim=1)
         role_chance, role_labels = torch.max(logitsr, dim=1)
+        return frame_labels, role_labels, frame_chance, role_chance
+
+    def label(self, gs):
+        frame_labels, role_labels, \
+            frame_chance, role_chance = self.label_indices(gs)
         frame_labels = frame_codec.inverse_transform(frame_labels)
         role_labels = role_codec.inverse_transform(role_labels)
         return frame_labels, role_labels, frame_chance, role_chance
+
+
+def label_classes(net):
+    """
+    The frame and role classes, to decode the output of label_indices,
+    of a Net or an ExportedNet (see stroll.export).
+    """
+    if hasattr(net, 'frames'):
+        return net.frames, net.roles
+    return frame_codec.classes_, role_codec.classes_
+
+
+def state_dict_label_feats(state_dict):
+    """
+    The label_feats of the Net of a state dict: an int for a net
+    converted with Net.to_index_input, else None.
+    """
+    if 'embedding.bias' not in state_dict:
+        return None
+    if 'embedding.labels.weight' not in state_dict:
+        return 0
+    return state_dict['embedding.labels.weight'].shape[0] - 1
+
+
+def quantize_net(net):
+    """
+    Dynamic int8 quantization of a Net, for inference on CPU.
+
+    The weights of the nn.Linear layers (in the Embedding and MLPs) and
+    the nn.GRU of the kernel are stored as int8, and the activations are
+    quantized on the fly; the relation weights of the kernel, and the
+    BatchNorm layers, stay float.
+
+    Returns:
+        a quantized copy of the net, in eval mode
+    """
+    net.eval()
+    return torch.quantization.quantize_dynamic(
+            net, {nn.Linear, nn.GRU}, dtype=torch.qint8
+            )
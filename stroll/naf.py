@@ -29,7 +29,7 @@ def write_frames_to_naf(naf, frames, sentence):
         pred_obj = Cpredicate()
         pred_obj.set_span(span_obj)
         pred_obj.set_uri('UNSET')  # TODO
-        pred_obj.set_confidence('{}'.format(frames[fid].p.numpy()))
+        pred_obj.set_confidence('{}'.format(frames[fid].p))
 
         # pred_obj.set_id('pr{}'.format(pred_counter)) # should be like pr\d+
         pred_obj.set_id('pr_s{}t{}'.format(sentence.sent_rank + 1, frames[fid].ID))
@@ -186,6 +186,7 @@ def load_naf_stdin():
     # A final conversion of our list of sentences to a ConlluDataset
     for sent_id in sentences:
         sentence = sentences[sent_id]
+        sentence.changed()
 
         # construct the sentence.full_text
         raw_tokens = []
@@ -193,8 +194,8 @@ def load_naf_stdin():
             raw_tokens.append(token.FORM)
         sentence.full_text = ' '.join(raw_tokens)
 
-        # add to the dataset
-        my_dataset.add(sentence)
+    # add to the dataset
+    my_dataset.extend(sentences.values())
 
     my_dataset.naf2conll_id = naf2conll_id
 
@@ -3,15 +3,17 @@ import logging
 import argparse
 from progress.bar import Bar
 from stroll.download import download_srl_model
-from stroll.model import Net
+from stroll.model import Net, quantize_net, state_dict_label_feats, \
+    label_classes
+from stroll.export import ExportedNet, is_exported
 from stroll.graph import ConlluDataset, GraphDataset
+from stroll.graph import ConlluStream, GraphStream, BucketBatchSampler
+from stroll.graph import BACKENDS, batch_graphs, split_batch
+from stroll.conllu import ConlluWriter, open_file
 from stroll.labels import FasttextEncoder
 from stroll.naf import write_frames_to_naf
 from stroll.naf import load_naf_stdin, write_frames_to_naf, write_header_to_naf
 
-import numpy as np
-import dgl
-
 import torch
 from torch.utils.data import DataLoader
 
@@ -21,14 +23,22 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     '--batch_size',
     dest='batch_size',
+    type=int,
     default=50,
-    help='Inference batch size.'
+    help='Inference batch size, for --stream or when --max_tokens is 0.'
+)
+parser.add_argument(
+    '--max_tokens',
+    type=int,
+    default=1000,
+    help='Batch sentences of similar length, with at most this many tokens '
+    'per batch. Results are written in the original order.'
 )
 parser.add_argument(
     '--model',
-    default='srl.pt',
     dest='model_name',
-    help='Model to use for inference'
+    help='Model to use for inference, in the models directory; srl.pt by '
+    'default, or a model exported with stroll.export'
 )
 parser.add_argument(
     '--naf',
@@ -38,7 +48,41 @@ parser.add_argument(
 )
 parser.add_argument(
     '--dataset',
-    help='Input in conll format from file',
+    help='Input in conll format from file, can be compressed (.gz/.xz/.zst)',
+)
+parser.add_argument(
+    '--output',
+    help='Write the conll output to a file instead of stdout, '
+    'compressed when it ends in .gz, .xz or .zst'
+)
+parser.add_argument(
+    '--stream',
+    default=False,
+    action='store_true',
+    help='Read the --dataset lazily, and print results while labelling'
+)
+parser.add_argument(
+    '--cache_dir',
+    help='Directory to cache the encoded graphs of the --dataset in'
+)
+parser.add_argument(
+    '--quantize',
+    default=False,
+    action='store_true',
+    help='Run the model with dynamic int8 quantization, faster on CPU'
+)
+parser.add_argument(
+    '--backend',
+    default='dgl',
+    choices=BACKENDS,
+    help="Graph backend: 'dgl', or 'torch' to run without DGL"
+)
+parser.add_argument(
+    '--index_input',
+    default=False,
+    action='store_true',
+    help='Encode the node features as label indices instead of one-hot, '
+    'using less memory; on by default for a converted model'
 )
 parser.add_argument(
     '--path',
@@ -87,34 +131,25 @@ class Frame():
         return string
 
 
-def adjacency_matrix(sentence):
-    # By mulitplying a position vector by the adjacency matrix,
-    # we can do one step along the dependency arc.
-    L = np.zeros([len(sentence)]*2, dtype=np.int)
-    for token in sentence:
-        if token.HEAD == "0":
-            continue
-        L[sentence.index(token.ID), sentence.index(token.HEAD)] = 1
-
-    return L
-
-
 def build_sentence_parts(sentence, subtree_ids):
-    to_descendants = adjacency_matrix(sentence)
-    # to_parent = to_descendants.transpos()
+    """
+    The words of the subtree of each of the given tokens.
 
-    # Raise the matrix to the len(sentence) power; this covers the
-    # case where the tree has maximum depth. But first add the unity
-    # matrix, so the starting word, and all words we reach, keep a non-zero
-    # value.
-    is_descendant = to_descendants + np.eye(len(sentence), dtype=np.int)
-    is_descendant = np.linalg.matrix_power(is_descendant, len(sentence))
+    Arguments:
+        sentence:     Sentence
+        subtree_ids:  iterable of str, the Token.ID of the subtree heads
+
+    Returns:
+        dicts from Token.ID to the list of FORMs, and of IDs, of its
+        subtree, in sentence order
+    """
+    tree = sentence.tree
 
     # collect the subtrees
     treetext = {}
     treeids = {}
     for wid in subtree_ids:
-        ids, = np.where(is_descendant[:, sentence.index(wid)] > 0)
+        ids = tree.subtree(sentence.index(wid))
         treetext[wid] = [sentence.tokens[i].FORM for i in ids]
         treeids[wid] = [sentence.tokens[i].ID for i in ids]
 
@@ -125,32 +160,30 @@ def find_frame(sentence, id):
     """Find a FRAME for the given word ID
     1. look at the parent, and take that if it is a frame.
     2. look at siblings: go to the parent, and consider all descendants"""
-
+    tree = sentence.tree
     candidates = []
 
     # # 1. look at the parent, and take that if it is a frame.
-    start = sentence[id]
-    if start.HEAD == '0':
+    start = sentence.index(id)
+    parent = int(tree.heads[start])
+    if parent == -1:
         # special case for the sentence's head
         # set its parent to itself, so we will look at all descencents
         # in the next step
         parent = start
     else:
-        parent = sentence[start.HEAD]
-        if parent.FRAME == 'rel':
-            return parent.ID
+        if sentence.tokens[parent].FRAME == 'rel':
+            return sentence.tokens[parent].ID
         else:
             # add the parent as candidate frame
-            candidates.append(parent)
+            candidates.append(sentence.tokens[parent])
 
     # 2. look at siblings: go to the parent, and consider all descendants
     #    but not itself
-    to_descendants = adjacency_matrix(sentence)
-    to_descendants[sentence.index(start.ID), sentence.index(parent.ID)] = 0
-
-    sibling_ids, = np.where(to_descendants[:, sentence.index(parent.ID)] > 0)
-    for sibling_id in sibling_ids:
-        sibling = sentence[sibling_id]
+    for sibling_id in tree.children[parent]:
+        if sibling_id == start:
+            continue
+        sibling = sentence.tokens[sibling_id]
         # allowed:     xcomp, compound:prt, ccomp, cop, obj? parataxis?
         allowed = ['xcomp', 'compound:prt', 'ccomp', 'cop']
         if sibling.DEPREL in allowed:
@@ -210,59 +243,118 @@ def make_frames(sentence):
     return frames, orphans
 
 
-def predict(net, loader, dataset, batch_size=50, naf_obj=None, progbar=None):
-    predicted_frames = []
-    predicted_roles = []
+def predict(net, loader, dataset, naf_obj=None, progbar=None, emit=None):
+    """
+    Label the sentences of a dataset, in the order given by the loader.
+
+    The frames are written to the NAF in document order, also when the
+    loader batches the sentences in a different order, ie. by length.
+    The emit function is called in the order of the loader.
+    """
+    # frames per sentence index, to write them to the NAF in order
+    naf_frames = {}
+
+    frame_classes, role_classes = label_classes(net)
 
     net.eval()
     with torch.no_grad():
         for gs in loader:
 
-            frame_labels, role_labels, \
-                frame_chance, role_chance = net.label(gs)
+            predictions = [
+                p.numpy() for p in net.label_indices(gs)
+            ]
+
+            for index, frame_labels, role_labels, frame_chance, role_chance \
+                    in split_batch(gs, *predictions):
+                sentence = dataset.conllu(index)
 
-            node_offset = 0
-            for g in dgl.unbatch(gs):
-                sentence = dataset.conllu(g)
-                for i, token in enumerate(sentence):
-                    token.ROLE = role_labels[i + node_offset]
-                    token.pROLE = role_chance[i + node_offset]
+                # decode the labels of the whole sentence at once
+                for token, frame, role, pframe, prole in zip(
+                        sentence,
+                        frame_classes[frame_labels],
+                        role_classes[role_labels],
+                        frame_chance,
+                        role_chance):
+                    token.ROLE = role
+                    token.pROLE = prole
 
-                    token.FRAME = frame_labels[i + node_offset]
-                    token.pFRAME = frame_chance[i + node_offset]
-                node_offset += len(g)
+                    token.FRAME = frame
+                    token.pFRAME = pframe
 
                 # match the predicate and roles by some simple graph traversal
                 # rules
                 frames, orphans = make_frames(sentence)
 
                 if naf_obj:
-                    write_frames_to_naf(naf_obj, frames, sentence)
+                    naf_frames[index] = (frames, sentence)
+
+                if emit:
+                    emit(sentence)
 
             if progbar:
-                progbar.next(batch_size)
+                progbar.next()
 
     if progbar:
         progbar.finish()
 
+    for index in sorted(naf_frames):
+        frames, sentence = naf_frames[index]
+        write_frames_to_naf(naf_obj, frames, sentence)
+
 
 if __name__ == '__main__':
     logger.setLevel(logging.INFO)
     args = parser.parse_args()
 
+    # the graph cache is keyed by the --dataset file, read all at once
+    if args.cache_dir and args.naf:
+        logger.error('The graph cache needs an input file, '
+                     'do not use --cache_dir with --naf.')
+        sys.exit(-1)
+    if args.cache_dir and args.stream:
+        logger.error('The graph cache is not used for streamed input, '
+                     'do not use --cache_dir with --stream.')
+        sys.exit(-1)
+
     # get Paths to default SRL and FastText models
-    fname_fasttext, fname_model = download_srl_model(datapath=args.path)
+    fname_fasttext, fname_model = download_srl_model(
+        datapath=args.path, name_model=args.model_name
+    )
 
-    state_dict = torch.load(fname_model)
+    if is_exported(fname_model):
+        # scripted model, with its features in the metadata
+        net = ExportedNet(fname_model)
+        features = net.features
+        if args.index_input:
+            logger.warning(
+                'Ignoring --index_input for an exported model.'
+            )
+        index_input = False
+    else:
+        state_dict = torch.load(fname_model)
+        hyperparams = state_dict.pop('hyperparams')
+        features = hyperparams.features
+        net = None
+
+        # a model converted with Net.to_index_input
+        label_feats = state_dict_label_feats(state_dict)
+        index_input = args.index_input or label_feats is not None
+
+    if index_input and args.cache_dir:
+        logger.error('The graph cache needs one-hot input, '
+                     'do not use --cache_dir with --index_input.')
+        sys.exit(-1)
 
-    hyperparams = state_dict.pop('hyperparams')
-    if 'WVEC' in hyperparams.features:
+    if 'WVEC' in features:
         sentence_encoder = FasttextEncoder(fname_fasttext)
     else:
         sentence_encoder = None
 
     if args.naf:
         dataset, naf = load_naf_stdin()
+    elif args.dataset and args.stream:
+        naf = None
+        dataset = ConlluStream(args.dataset)
     elif args.dataset:
         naf = None
         dataset = ConlluDataset(args.dataset)
@@ -270,33 +362,103 @@ if __name__ == '__main__':
         logger.error('No input, you must use --naf or --dataset.')
         sys.exit(-1)
 
-    eval_set = GraphDataset(
-        dataset=dataset,
-        sentence_encoder=sentence_encoder,
-        features=hyperparams.features
-    )
-    evalloader = DataLoader(
-        eval_set,
-        batch_size=args.batch_size,
-        num_workers=2,
-        collate_fn=dgl.batch
-    )
+    if isinstance(dataset, ConlluStream):
+        # sentences are looked up again after labelling, so the graphs
+        # have to be made in this process
+        eval_set = GraphStream(
+            dataset=dataset,
+            sentence_encoder=sentence_encoder,
+            features=features,
+            window=max(1000, args.batch_size),
+            backend=args.backend,
+            index_input=index_input
+        )
+        evalloader = DataLoader(
+            eval_set,
+            batch_size=args.batch_size,
+            num_workers=0,
+            collate_fn=batch_graphs
+        )
+    else:
+        workers = 2
+        if sentence_encoder:
+            sentence_encoder.share_statistics(workers)
+
+        eval_set = GraphDataset(
+            args.dataset,
+            dataset=dataset,
+            sentence_encoder=sentence_encoder,
+            features=features,
+            cache_dir=args.cache_dir,
+            backend=args.backend,
+            index_input=index_input
+        )
+        if args.max_tokens:
+            # sorted by length, without shuffling
+            evalloader = DataLoader(
+                eval_set,
+                batch_sampler=BucketBatchSampler(
+                    eval_set.sentence_lengths(),
+                    args.max_tokens,
+                    shuffle=False
+                ),
+                num_workers=workers,
+                collate_fn=batch_graphs
+            )
+        else:
+            evalloader = DataLoader(
+                eval_set,
+                batch_size=args.batch_size,
+                num_workers=workers,
+                collate_fn=batch_graphs
+            )
 
-    net = Net(
-        in_feats=eval_set.in_feats,
-        h_layers=hyperparams.h_layers,
-        h_dims=hyperparams.h_dims,
-        out_feats_a=2,
-        out_feats_b=19,
-        activation='relu'
-    )
-    net.load_state_dict(state_dict)
+    if net is None:
+        net = Net(
+            in_feats=eval_set.in_feats,
+            h_layers=hyperparams.h_layers,
+            h_dims=hyperparams.h_dims,
+            out_feats_a=2,
+            out_feats_b=19,
+            activation='relu',
+            label_feats=label_feats
+        )
+        net.load_state_dict(state_dict)
+        if index_input:
+            net = net.to_index_input(features)
+        net = net.optimize_for_inference()
+        if args.quantize:
+            net = quantize_net(net)
+    elif args.quantize:
+        logger.warning(
+            'Ignoring --quantize for an exported model, '
+            'use stroll.export --quantize instead.'
+        )
 
-    progbar = Bar('Evaluating', max=len(evalloader))
-    predict(net, evalloader, eval_set, batch_size=50, naf_obj=naf, progbar=progbar)
+    if args.output:
+        outfile = open_file(args.output, 'w')
+    else:
+        outfile = sys.stdout
+
+    if isinstance(eval_set, GraphStream):
+        writer = ConlluWriter(outfile)
+        predict(net, evalloader, eval_set, emit=writer.write)
+        writer.flush()
+    else:
+        progbar = Bar('Evaluating', max=len(evalloader))
+        predict(net, evalloader, eval_set, naf_obj=naf, progbar=progbar)
+
+    if sentence_encoder and sentence_encoder.statistics()['misses']:
+        logger.info(
+            'Word vector cache: {hits} hits, {misses} misses, '
+            '{hit_rate:.1%} hit rate'.format(**sentence_encoder.statistics())
+        )
 
     if args.naf:
         write_header_to_naf(naf)
         naf.dump()
-    else:
-        print(dataset)
+    elif not args.stream:
+        dataset.dump(outfile)
+
+    if args.output:
+        outfile.close()
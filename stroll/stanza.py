@@ -1,15 +1,15 @@
 import stanza
 import torch
-import dgl
 
 from pathlib import Path
 
 from stroll.conllu import Token, Sentence, ConlluDataset
-from stroll.graph import GraphDataset
+from stroll.graph import GraphDataset, batch_graphs, split_batch
 from stroll.labels import FasttextEncoder, get_dims_for_features
-from stroll.model import Net
+from stroll.model import Net, quantize_net, state_dict_label_feats, \
+    label_classes
+from stroll.export import ExportedNet, is_exported
 from stroll.download import download_srl_model
-from stroll.srl import predict
 
 from stanza.pipeline.processor import Processor, register_processor
 from stanza.models.common.doc import Document
@@ -35,30 +35,55 @@ class SrlProcessor(Processor):
     def __init__(self, config, pipeline, use_gpu):
         # get Paths to default SRL and FastText models
         datapath = Path(config['model_path']).parent
-        fname_fasttext, fname_model = download_srl_model(datapath=datapath)
-
-        state_dict = torch.load(fname_model)
-
-        hyperparams = state_dict.pop('hyperparams')
-
-        self.features = hyperparams.features
+        # srl.pt, or a model exported with stroll.export
+        fname_fasttext, fname_model = download_srl_model(
+            datapath=datapath, name_model=config.get('model_name')
+        )
 
-        in_feats = get_dims_for_features(hyperparams.features)
-        if 'WVEC' in hyperparams.features:
+        if is_exported(fname_model):
+            self.net = ExportedNet(fname_model)
+            self.features = self.net.features
+            self.index_input = False
+        else:
+            state_dict = torch.load(fname_model)
+            hyperparams = state_dict.pop('hyperparams')
+            self.features = hyperparams.features
+            self.net = None
+
+            # label indices instead of one-hot node features, using less
+            # memory; always for a model converted with Net.to_index_input
+            label_feats = state_dict_label_feats(state_dict)
+            self.index_input = config.get('index_input', False) or \
+                label_feats is not None
+
+        # 'dgl', or 'torch' to run without DGL
+        self.backend = config.get('backend', 'dgl')
+
+        in_feats = get_dims_for_features(self.features)
+        if 'WVEC' in self.features:
             self.sentence_encoder = FasttextEncoder(fname_fasttext)
             in_feats += self.sentence_encoder.dims
         else:
             self.sentence_encoder = None
 
-        self.net = Net(
-            in_feats=in_feats,
-            h_layers=hyperparams.h_layers,
-            h_dims=hyperparams.h_dims,
-            out_feats_a=2,
-            out_feats_b=19,
-            activation='relu'
-        )
-        self.net.load_state_dict(state_dict)
+        if self.net is None:
+            self.net = Net(
+                in_feats=in_feats,
+                h_layers=hyperparams.h_layers,
+                h_dims=hyperparams.h_dims,
+                out_feats_a=2,
+                out_feats_b=19,
+                activation='relu',
+                label_feats=label_feats
+            )
+            self.net.load_state_dict(state_dict)
+            if self.index_input:
+                self.net = self.net.to_index_input(self.features)
+            self.net = self.net.optimize_for_inference()
+
+            # dynamic int8 quantization, faster on CPU
+            if config.get('quantize', False):
+                self.net = quantize_net(self.net)
 
     def _set_up_model(self, *args):
         print ('_set_up_model')
@@ -69,6 +94,7 @@ class SrlProcessor(Processor):
         dicts = doc.to_dict()
         dataset = ConlluDataset()
 
+        sentences = []
         for sent_id, input_sentence in enumerate(doc.sentences):
             sentence = Sentence()
             for w in input_sentence.words:
@@ -90,36 +116,42 @@ class SrlProcessor(Processor):
             sentence.full_text = ''
             sentence.doc_id = ''
             sentence.sent_id = str(sent_id)
-            dataset.add(sentence)
+            sentences.append(sentence)
+
+        dataset.extend(sentences)
 
         # run stroll
         eval_set = GraphDataset(
             dataset=dataset,
             sentence_encoder=self.sentence_encoder,
-            features=self.features
+            features=self.features,
+            backend=self.backend,
+            index_input=self.index_input
         )
         evalloader = DataLoader(
             eval_set,
             # batch_size=50,  # TODO make configurable
             # num_workers=2,  # TODO make configurable
-            collate_fn=dgl.batch
+            collate_fn=batch_graphs
         )
 
+        frame_classes, role_classes = label_classes(self.net)
+
         self.net.eval()
         with torch.no_grad():
-            sent_id = 0
             for gs in evalloader:
+                predictions = [
+                    p.numpy() for p in self.net.label_indices(gs)
+                ]
 
-                frame_labels, role_labels, \
-                    frame_chance, role_chance = self.net.label(gs)
-
-                word_offset = 0
-                for g in dgl.unbatch(gs):
+                for sent_id, frame_labels, role_labels, _, _ in \
+                        split_batch(gs, *predictions):
                     input_sentence = doc.sentences[sent_id]
-                    for w, word in enumerate(input_sentence.words):
-                        word.srl = role_labels[w + word_offset]
-                        word.frame = frame_labels[w + word_offset]
-                    word_offset += len(g)
-                    sent_id += 1
+                    for word, frame, role in zip(
+                            input_sentence.words,
+                            frame_classes[frame_labels],
+                            role_classes[role_labels]):
+                        word.srl = role
+                        word.frame = frame
 
         return doc
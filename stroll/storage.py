@@ -0,0 +1,98 @@
+"""
+Shared helpers for the on-disk directory formats.
+
+The binary corpus (stroll.corpus), the graph cache (stroll.cache), and the
+word vector table (stroll.vectors) are each a directory of numpy files
+with a meta.json. They are written with write_directory, so an interrupted
+write never leaves a directory that looks complete, and are read with
+read_meta and load_array.
+"""
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+
+@contextmanager
+def write_directory(path):
+    """
+    Write a directory in a temporary directory, which replaces path when
+    the block completes; on an error, the temporary directory is removed.
+
+        with write_directory(path) as tmp_path:
+            save_array(tmp_path, 'values', values)
+            write_meta(tmp_path, meta)
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    try:
+        yield tmp_path
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def save_array(path, name, values, dtype=None):
+    """Save values as <path>/<name>.npy, converted to dtype if given."""
+    np.save(os.path.join(path, name + '.npy'), np.asarray(values, dtype=dtype))
+
+
+def load_array(path, name):
+    """Open <path>/<name>.npy as a read-only memory map."""
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+
+def write_meta(path, meta):
+    """
+    Write meta.json; write it last, a directory without it is incomplete.
+    """
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def read_meta(path, version, kind):
+    """
+    Read meta.json, and check its version.
+
+    Arguments:
+        path:     the directory
+        version:  int, the supported version
+        kind:     str, name of the format, for the error message
+
+    Returns:
+        dict, the metadata
+
+    Raises:
+        FileNotFoundError for an incomplete directory, ValueError for an
+        unsupported version
+    """
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta['version'] != version:
+        raise ValueError('Unsupported {} version {} in {}'.format(
+            kind, meta['version'], path
+        ))
+    return meta
+
+
+class MemoryMapped():
+    """
+    Base class for readers of a directory opened as memory maps.
+
+    Pickling only stores the path, and __init__(path) opens the memory
+    maps again, ie. in DataLoader workers.
+    """
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
@@ -0,0 +1,236 @@
+"""
+Exported, memory-mapped, fasttext word vectors.
+
+A fasttext .bin model holds the full training state, and loading it reads
+all of it into memory, for every process using it. The word vectors only
+need the input matrix, and the subword hashing; export_vectors writes
+those to a directory:
+  meta.json          version, dims, minn, maxn, bucket, and sizes
+  vectors.npy        float32/16 [words, dims], the vector of each vocabulary word
+  buckets.npy        float32/16 [bucket, dims], the subword n-gram vectors
+  words.bin          the vocabulary words, utf-8, concatenated
+  word_offsets.npy   int64 [words + 1], start of each word in words.bin
+  word_table.npy     int32 [table size], open addressing hash table,
+                     word hash -> word, -1 for empty slots
+
+The arrays are opened with numpy.memmap, so opening the table is fast, and
+processes using the same table share one copy in the page cache.
+
+VectorTable computes the vectors of out-of-vocabulary words as fasttext
+does: the average of the vectors of the character n-grams of '<word>'.
+The vectors are the same as fasttext's, unless exported as float16.
+
+Export a model with:
+  python -m stroll.vectors models/fasttext.model.bin models/fasttext.vectors
+"""
+import argparse
+import logging
+import os
+
+import numpy as np
+
+from .storage import MemoryMapped, write_directory, save_array, load_array, \
+    write_meta, read_meta
+
+
+VECTORS_VERSION = 1
+
+parser = argparse.ArgumentParser(
+    description='Export the word vectors of a fasttext model to a memory-mappable table'
+)
+parser.add_argument(
+    'model',
+    help='Fasttext model (.bin)'
+)
+parser.add_argument(
+    'output',
+    help='Output directory, ie. models/fasttext.vectors'
+)
+parser.add_argument(
+    '--float16',
+    default=False,
+    action='store_true',
+    help='Store the vectors as float16, halving the size'
+)
+
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+
+
+def fasttext_hash(data):
+    """
+    The 32 bit FNV-1a hash of a bytes object, as used by fasttext.
+
+    NOTE: fasttext hashes the bytes as signed chars, so bytes >= 0x80 are
+    sign-extended before the xor.
+    """
+    h = 2166136261
+    for c in data:
+        if c >= 0x80:
+            c |= 0xffffff00
+        h = ((h ^ c) * 16777619) & 0xffffffff
+    return h
+
+
+def ngram_hashes(word, minn, maxn):
+    """
+    The hashes of the character n-grams of '<word>', minn <= n <= maxn.
+
+    Characters are utf-8 sequences, as in fasttext; the single character
+    n-grams '<' and '>' are not used.
+    """
+    if maxn <= 0:
+        return []
+
+    data = ('<' + word + '>').encode('utf-8')
+
+    # the start of each utf-8 encoded character
+    starts = [i for i, c in enumerate(data) if c & 0xc0 != 0x80]
+    starts.append(len(data))
+
+    hashes = []
+    for i in range(len(starts) - 1):
+        for n in range(minn, maxn + 1):
+            if i + n >= len(starts):
+                break
+            if n == 1 and (i == 0 or i + n == len(starts) - 1):
+                continue
+            hashes.append(fasttext_hash(data[starts[i]:starts[i + n]]))
+    return hashes
+
+
+def export_vectors(model, path, float16=False):
+    """
+    Export the word vectors of a fasttext model.
+
+    The table is written to a temporary directory first, see
+    stroll.storage.write_directory, and replaces the directory at path.
+
+    Arguments:
+        model:    filename of the fasttext model (.bin)
+        path:     output directory
+        float16:  store the vectors as float16
+    """
+    import fasttext
+
+    ft = fasttext.load_model(model)
+    if ft.f.isQuant():
+        raise ValueError('Quantized fasttext models are not supported')
+    ft_args = ft.f.getArgs()
+    dims = ft.get_dimension()
+    words = ft.get_words(include_freq=False)
+    dtype = np.float16 if float16 else np.float32
+
+    with write_directory(path) as tmp_path:
+        # vocabulary words: the vector of the word plus its n-grams
+        vectors = np.empty([len(words), dims], dtype=dtype)
+        for i, word in enumerate(words):
+            vectors[i] = ft.get_word_vector(word)
+        save_array(tmp_path, 'vectors', vectors)
+        del vectors
+
+        # the subword n-grams are the rows after the words in the input matrix
+        save_array(
+            tmp_path, 'buckets', ft.get_input_matrix()[len(words):], dtype
+        )
+
+        encoded = [word.encode('utf-8') for word in words]
+        with open(os.path.join(tmp_path, 'words.bin'), 'wb') as f:
+            for word in encoded:
+                f.write(word)
+        word_offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=word_offsets[1:])
+        save_array(tmp_path, 'word_offsets', word_offsets)
+
+        # at most half full, for short probe sequences
+        size = 1
+        while size < 2 * len(words):
+            size *= 2
+        table = np.full(size, -1, dtype=np.int32)
+        for i, word in enumerate(encoded):
+            slot = fasttext_hash(word) % size
+            while table[slot] != -1:
+                slot = (slot + 1) % size
+            table[slot] = i
+        save_array(tmp_path, 'word_table', table)
+
+        write_meta(tmp_path, {
+            'version': VECTORS_VERSION,
+            'source': os.path.abspath(model),
+            'dims': dims,
+            'minn': ft_args.minn,
+            'maxn': ft_args.maxn,
+            'bucket': ft_args.bucket,
+            'words': len(words),
+            'dtype': np.dtype(dtype).name
+            })
+
+
+class VectorTable(MemoryMapped):
+    """
+    Memory-mapped word vectors, exported by export_vectors.
+
+    It has the word vector methods of a fasttext model, so it can be used
+    in its place:
+        table = VectorTable('models/fasttext.vectors')
+        vector = table.get_word_vector('fiets')
+    """
+    def __init__(self, path):
+        self.path = path
+        self.meta = read_meta(path, VECTORS_VERSION, 'vector table')
+
+        self.vectors = load_array(path, 'vectors')
+        self.buckets = load_array(path, 'buckets')
+        self.word_offsets = load_array(path, 'word_offsets')
+        self.word_table = load_array(path, 'word_table')
+        self.words = np.memmap(
+            os.path.join(path, 'words.bin'), dtype=np.uint8, mode='r'
+        ) if self.word_offsets[-1] else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.meta['words']
+
+    def get_dimension(self):
+        return self.meta['dims']
+
+    def get_word_id(self, word):
+        """The index of a vocabulary word, or -1 for unknown words."""
+        data = word.encode('utf-8')
+        size = len(self.word_table)
+        slot = fasttext_hash(data) % size
+        while True:
+            i = self.word_table[slot]
+            if i == -1:
+                return -1
+            start, end = self.word_offsets[i:i + 2]
+            if self.words[start:end].tobytes() == data:
+                return int(i)
+            slot = (slot + 1) % size
+
+    def get_word_vector(self, word):
+        """The vector of a word, as float32 numpy array [dims]."""
+        i = self.get_word_id(word)
+        if i >= 0:
+            return np.array(self.vectors[i], dtype=np.float32)
+
+        # unknown words: the average of the n-gram vectors
+        vector = np.zeros(self.meta['dims'], dtype=np.float32)
+        hashes = ngram_hashes(word, self.meta['minn'], self.meta['maxn'])
+        if not hashes:
+            return vector
+
+        # add the rows one by one, in float32, as fasttext does
+        bucket = self.meta['bucket']
+        for h in hashes:
+            vector += self.buckets[h % bucket]
+        vector *= np.float32(1.0 / len(hashes))
+        return vector
+
+
+if __name__ == '__main__':
+    logger.setLevel(logging.INFO)
+    args = parser.parse_args()
+
+    logger.info('Exporting {} to {}'.format(args.model, args.output))
+    export_vectors(args.model, args.output, float16=args.float16)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Benchmark the binary corpus against conllu text files'
+        )
+parser.add_argument(
+        '--docs',
+        type=int,
+        default=20000,
+        help='Number of documents in the synthetic corpus'
+        )
+parser.add_argument(
+        '--sentences',
+        type=int,
+        default=3,
+        help='Number of sentences per document'
+        )
+
+# Each case runs in a fresh interpreter, so the peak RSS is its own.
+# It prints: seconds, peak RSS in MB, and the RSS after the imports.
+CASE = '''
+import resource, time
+from stroll.conllu import ConlluDataset
+from stroll.corpus import BinaryCorpus
+rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+{}
+t = time.perf_counter() - t0
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(t, rss / 1024., rss0 / 1024.)
+'''
+
+CASES = [
+    ('ConlluDataset(conllu)',
+     'd = ConlluDataset("{conllu}")'),
+    ('ConlluDataset.from_binary',
+     'd = ConlluDataset.from_binary("{binary}")'),
+    ('BinaryCorpus',
+     'd = BinaryCorpus("{binary}")'),
+    ('BinaryCorpus, 1% sentences',
+     'd = BinaryCorpus("{binary}")\n'
+     '[d[i] for i in range(0, len(d), 100)]'),
+    ]
+
+
+def run_case(code):
+    env = dict(os.environ)
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = package + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.run(
+            [sys.executable, '-c', CASE.format(code)],
+            env=env, check=True, capture_output=True, text=True
+            ).stdout
+    return [float(x) for x in output.split()]
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        conllu = os.path.join(tmpdir, 'synthetic.conllu')
+        binary = os.path.join(tmpdir, 'synthetic')
+        write_synthetic_conllu(
+                conllu, docs=args.docs, sentences=args.sentences
+                )
+        run_case('from stroll.corpus import write_binary\n'
+                 'write_binary(ConlluDataset("{}"), "{}")'.format(
+                     conllu, binary))
+
+        print('{:28s} {:>10s} {:>14s} {:>16s}'.format(
+            'case', 'time [s]', 'peak RSS [MB]', 'after import [MB]'
+            ))
+        for name, code in CASES:
+            t, rss, rss0 = run_case(
+                    code.format(conllu=conllu, binary=binary)
+                    )
+            print('{:28s} {:10.3f} {:14.1f} {:16.1f}'.format(
+                name, t, rss, rss0
+                ))
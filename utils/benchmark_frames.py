@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import time
+
+import numpy as np
+
+from stroll.conllu import Sentence, Token
+from stroll.srl import make_frames, build_sentence_parts, find_frame
+import stroll.srl
+from synthetic_conllu import synthetic_sentence
+
+parser = argparse.ArgumentParser(
+        description='Benchmark make_frames, with the subtrees from a tree '
+        'traversal, against the powers of the adjacency matrix'
+        )
+parser.add_argument(
+        '--lengths',
+        nargs='*',
+        type=int,
+        default=[10, 20, 50, 100, 200, 500],
+        help='Sentence lengths in tokens'
+        )
+parser.add_argument(
+        '--sentences',
+        type=int,
+        default=20,
+        help='Number of sentences per length'
+        )
+parser.add_argument(
+        '--max_legacy',
+        type=int,
+        default=500,
+        help='Longest sentence to run the adjacency matrix version on'
+        )
+
+
+def legacy_adjacency_matrix(sentence):
+    L = np.zeros([len(sentence)]*2, dtype=np.int64)
+    for token in sentence:
+        if token.HEAD == "0":
+            continue
+        L[sentence.index(token.ID), sentence.index(token.HEAD)] = 1
+
+    return L
+
+
+def legacy_build_sentence_parts(sentence, subtree_ids):
+    """build_sentence_parts as it was: the N-th power of the adjacency"""
+    to_descendants = legacy_adjacency_matrix(sentence)
+    is_descendant = to_descendants + np.eye(len(sentence), dtype=np.int64)
+    is_descendant = np.linalg.matrix_power(is_descendant, len(sentence))
+
+    treetext = {}
+    treeids = {}
+    for wid in subtree_ids:
+        ids, = np.where(is_descendant[:, sentence.index(wid)] > 0)
+        treetext[wid] = [sentence.tokens[i].FORM for i in ids]
+        treeids[wid] = [sentence.tokens[i].ID for i in ids]
+
+    return treetext, treeids
+
+
+def legacy_find_frame(sentence, id):
+    """find_frame as it was: the siblings from the adjacency matrix"""
+    candidates = []
+    start = sentence[id]
+    if start.HEAD == '0':
+        parent = start
+    else:
+        parent = sentence[start.HEAD]
+        if parent.FRAME == 'rel':
+            return parent.ID
+        else:
+            candidates.append(parent)
+
+    to_descendants = legacy_adjacency_matrix(sentence)
+    to_descendants[sentence.index(start.ID), sentence.index(parent.ID)] = 0
+
+    sibling_ids, = np.where(to_descendants[:, sentence.index(parent.ID)] > 0)
+    for sibling_id in sibling_ids:
+        sibling = sentence[sibling_id]
+        allowed = ['xcomp', 'compound:prt', 'ccomp', 'cop']
+        if sibling.DEPREL in allowed:
+            if sibling.FRAME == 'rel':
+                return sibling.ID
+            else:
+                candidates.append(sibling)
+
+    for candidate in candidates:
+        if candidate.UPOS in ['VERB', 'AUX']:
+            return candidate.ID
+
+    return None
+
+
+def make_sentences(rng, length, count, chain=False):
+    """Random labelled sentences; with chain, every head is the previous word"""
+    sentences = []
+    for s in range(count):
+        sentence = Sentence(sent_id=str(s), full_text='')
+        for line in synthetic_sentence(rng, length, str(s))[2:]:
+            fields = line.split('\t')
+            if chain:
+                fields[6] = str(int(fields[0]) - 1)
+            sentence.add(Token(fields))
+        sentences.append(sentence)
+    return sentences
+
+
+def summary(frames, orphans):
+    """The frames of a sentence, as comparable values"""
+    result = []
+    for frame in list(frames.values()) + [orphans]:
+        result.append((frame.ID, [
+            (a['id'], a['role'], a['ids']) for a in frame.arguments
+            ]))
+    return result
+
+
+def run(sentences, legacy):
+    """The frames of all sentences, and the time per sentence"""
+    if legacy:
+        stroll.srl.build_sentence_parts = legacy_build_sentence_parts
+        stroll.srl.find_frame = legacy_find_frame
+    else:
+        stroll.srl.build_sentence_parts = build_sentence_parts
+        stroll.srl.find_frame = find_frame
+
+    t0 = time.perf_counter()
+    results = [summary(*make_frames(sentence)) for sentence in sentences]
+    return results, (time.perf_counter() - t0) / len(sentences)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print('{:>6s} {:>8s} {:>12s} {:>12s} {:>8s} {:>10s}'.format(
+        'tokens', 'tree', 'matrix ms', 'traverse ms', 'speedup', 'differ'
+        ))
+    for length in args.lengths:
+        for chain in [False, True]:
+            sentences = make_sentences(rng, length, args.sentences, chain)
+            new, t_new = run(sentences, legacy=False)
+            if length > args.max_legacy:
+                print('{:>6d} {:>8s} {:>12s} {:12.3f}'.format(
+                    length, 'chain' if chain else 'random', '-', 1000 * t_new
+                    ))
+                continue
+
+            old, t_old = run(sentences, legacy=True)
+
+            # the matrix powers overflow on deep trees, giving other subtrees
+            differ = sum(a != b for a, b in zip(old, new))
+            print('{:>6d} {:>8s} {:12.3f} {:12.3f} {:8.1f} {:>10s}'.format(
+                length, 'chain' if chain else 'random', 1000 * t_old,
+                1000 * t_new, t_old / t_new,
+                '{}/{}'.format(differ, len(sentences))
+                ))
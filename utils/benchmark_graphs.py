@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+import dgl
+import torch
+
+from stroll.conllu import ConlluDataset
+from stroll.graph import make_graph, \
+        RELATION_TYPE_SELF, RELATION_TYPE_HEAD, RELATION_TYPE_CHILD
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Benchmark building sentence graphs'
+        )
+parser.add_argument(
+        '--sentences',
+        type=int,
+        default=2000,
+        help='Number of sentences'
+        )
+parser.add_argument(
+        '--tokens',
+        type=int,
+        default=15,
+        help='Average number of tokens per sentence'
+        )
+parser.add_argument(
+        '--features',
+        nargs='*',
+        default=['UPOS', 'XPOS', 'FEATS', 'DEPREL'],
+        help='Features to use as node data'
+        )
+
+
+def legacy_make_graph(conllu_sentence, index, features, sentence_encoder=None):
+    """make_graph as it was: one add_nodes or add_edges call per token"""
+    g = dgl.DGLGraph()
+
+    g.sentence = conllu_sentence
+    sentence = g.sentence.encode(
+            sentence_encoder=sentence_encoder
+            )
+
+    # add nodes
+    for token in sentence:
+        g.add_nodes(1, {
+            'v': torch.cat(
+                [token[f] for f in features],
+                0).view(1, -1),
+            'frame': token.FRAME,
+            'role': token.ROLE,
+            'sent_index': torch.tensor([index], dtype=torch.int32),
+            'token_index': torch.tensor(
+                [sentence.index(token.ID)],
+                dtype=torch.int32
+                )
+            })
+
+    # add edges: word -> head
+    for token in sentence:
+        if token.HEAD != '0' and token.HEAD != '_':
+            g.add_edges(
+                    sentence.index(token.ID),
+                    sentence.index(token.HEAD),
+                    {'rel_type': RELATION_TYPE_HEAD}
+                    )
+
+    # add 1/(3 * in_degree) as a weight factor
+    for token in sentence:
+        in_edges = g.in_edges(sentence.index(token.ID), form='eid')
+        if len(in_edges):
+            norm = torch.ones([len(in_edges)]) * \
+                    (1.0 / (3.0 * len(in_edges)))
+            g.edges[in_edges].data['norm'] = norm
+
+    # add edges, these are self-edges, or reversed dependencies
+    # give them a weight of 1/3
+    norm = torch.tensor([1.0 / 3.0])
+    for token in sentence:
+        # word -> word (self edge)
+        g.add_edges(
+                sentence.index(token.ID),
+                sentence.index(token.ID),
+                {'rel_type': RELATION_TYPE_SELF, 'norm': norm}
+                )
+
+        if token.HEAD != '0' and token.HEAD != '_':
+            # head -> word
+            g.add_edges(
+                    sentence.index(token.HEAD),
+                    sentence.index(token.ID),
+                    {'rel_type': RELATION_TYPE_CHILD, 'norm': norm}
+                    )
+    return g
+
+
+def graphs_per_second(build, dataset, features):
+    t0 = time.perf_counter()
+    graphs = [build(s, i, features) for i, s in enumerate(dataset)]
+    return len(graphs) / (time.perf_counter() - t0), graphs
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # DGL warns about the DGLGraph() constructor used by the legacy version
+    warnings.simplefilter('ignore')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'synthetic.conllu')
+        write_synthetic_conllu(
+                filename, docs=args.sentences, sentences=1,
+                tokens=args.tokens
+                )
+        dataset = ConlluDataset(filename)
+
+    legacy, old = graphs_per_second(legacy_make_graph, dataset, args.features)
+    bulk, new = graphs_per_second(make_graph, dataset, args.features)
+
+    # both should give the same graphs
+    for a, b in zip(old, new):
+        assert torch.equal(a.edges()[0], b.edges()[0])
+        assert torch.equal(a.edges()[1], b.edges()[1])
+        for key in ['rel_type', 'norm']:
+            assert torch.equal(a.edata[key], b.edata[key])
+        for key in ['v', 'frame', 'role', 'sent_index', 'token_index']:
+            assert torch.equal(a.ndata[key], b.ndata[key])
+
+    print('{:>12s} {:>14s}'.format('version', 'graphs/sec'))
+    print('{:>12s} {:14.1f}'.format('per token', legacy))
+    print('{:>12s} {:14.1f}'.format('bulk', bulk))
+    print('speedup: {:.1f}x'.format(bulk / legacy))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import torch
+
+from stroll.graph import GraphDataset, batch_graphs
+from stroll.labels import FasttextEncoder
+from stroll.model import Net
+
+parser = argparse.ArgumentParser(
+        description='Check that a net on label indices gives the same labels '
+        'as on one-hot node features, and compare memory and speed'
+        )
+parser.add_argument(
+        '--model',
+        dest='model_name',
+        help='Model to check, on one-hot node features',
+        required=True
+        )
+parser.add_argument(
+        'dataset',
+        help='Dataset in conllu format, or a binary corpus',
+        )
+parser.add_argument(
+        '--fasttext',
+        help='Fasttext model, when not the one the model was trained with'
+        )
+parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=50,
+        help='Batch size'
+        )
+parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of runs to time, the fastest is reported'
+        )
+
+
+def make_batches(dataset, batch_size):
+    """The batched graphs, and the time it took to make them"""
+    t0 = time.perf_counter()
+    batches = [
+        batch_graphs([
+            dataset[i] for i in range(
+                start, min(start + batch_size, len(dataset))
+                )
+            ])
+        for start in range(0, len(dataset), batch_size)
+        ]
+    return batches, time.perf_counter() - t0
+
+
+def input_bytes(batches):
+    """Bytes in the node features of the batches"""
+    total = 0
+    for g in batches:
+        for name in ['v', 'labels', 'wvec']:
+            if name in g.ndata:
+                tensor = g.ndata[name]
+                total += tensor.element_size() * tensor.nelement()
+    return total
+
+
+def run(net, batches, repeat):
+    """The labels and chances of all batches, and the fastest time"""
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            results = [net.label(g) for g in batches]
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return results, best
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    torch.set_num_threads(1)
+
+    state_dict = torch.load(args.model_name)
+    hyperparams = state_dict.pop('hyperparams')
+
+    if 'WVEC' in hyperparams.features:
+        sentence_encoder = FasttextEncoder(
+                args.fasttext or hyperparams.fasttext
+                )
+    else:
+        sentence_encoder = None
+
+    results = []
+    for index_input in [False, True]:
+        eval_set = GraphDataset(
+                args.dataset,
+                sentence_encoder=sentence_encoder,
+                features=hyperparams.features,
+                backend='torch',
+                index_input=index_input
+                )
+        batches, t_graphs = make_batches(eval_set, args.batch_size)
+
+        net = Net(
+                in_feats=eval_set.in_feats,
+                h_layers=hyperparams.h_layers,
+                h_dims=hyperparams.h_dims,
+                out_feats_a=2,
+                out_feats_b=19,
+                activation='relu'
+                )
+        net.load_state_dict(state_dict)
+        if index_input:
+            net = net.to_index_input(hyperparams.features)
+        net = net.optimize_for_inference()
+
+        labels, t_net = run(net, batches, args.repeat)
+        words = sum(len(g) for g in batches)
+        results.append((
+            'index' if index_input else 'one-hot',
+            labels, words, input_bytes(batches), t_graphs, t_net
+            ))
+
+    # the labels should be identical, the chances up to float rounding
+    error = 0.
+    for a, b in zip(results[0][1], results[1][1]):
+        assert (a[0] == b[0]).all(), 'Frame labels differ'
+        assert (a[1] == b[1]).all(), 'Role labels differ'
+        error = max(
+            error,
+            (a[2] - b[2]).abs().max().item(),
+            (a[3] - b[3]).abs().max().item()
+            )
+    print('labels identical for {} words, chances differ at most {:.2e}'.format(
+        results[0][2], error
+        ))
+
+    print('{:>10s} {:>14s} {:>14s} {:>14s}'.format(
+        'input', 'bytes/word', 'graphs w/s', 'net w/s'
+        ))
+    for name, _, words, size, t_graphs, t_net in results:
+        print('{:>10s} {:14.1f} {:14.0f} {:14.0f}'.format(
+            name, size / words, words / t_graphs, words / t_net
+            ))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import dgl
+import dgl.function as fn
+import torch
+
+from stroll.conllu import ConlluDataset
+from stroll.graph import make_graph
+from stroll.model import RGCNGRU
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Benchmark the message passing of the RGCNGRU kernel'
+        )
+parser.add_argument(
+        '--batch_sizes',
+        nargs='*',
+        type=int,
+        default=[10, 50, 200, 1000],
+        help='Number of sentences per batch'
+        )
+parser.add_argument(
+        '--h_dims',
+        type=int,
+        default=100,
+        help='Dimension of the hidden state'
+        )
+parser.add_argument(
+        '--h_layers',
+        type=int,
+        default=4,
+        help='Number of message passing steps'
+        )
+parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of forward/backward passes to time'
+        )
+
+
+class LegacyRGCNGRU(RGCNGRU):
+    """RGCNGRU as it was: a weight matrix gathered per edge"""
+    def forward(self, graph):
+        weight = self.weight
+        num_nodes = graph.number_of_nodes()
+
+        def rgcn_msg(edges):
+            w = weight[edges.data['rel_type']]
+            n = edges.data['norm']
+            msg = torch.bmm(edges.src['output'].unsqueeze(1), w).squeeze()
+            msg = torch.bmm(n.reshape(-1, 1, 1), msg.unsqueeze(1)).squeeze()
+
+            return {'m': msg}
+
+        rgcn_reduce = fn.sum(msg='m', out='Swh')
+
+        def rgcn_apply(nodes):
+            output, h_next = self.gru(
+                    nodes.data.pop('Swh').view(1, num_nodes, self.out_feats),
+                    nodes.data.pop('h').view(1, num_nodes, self.out_feats)
+                    )
+
+            return {
+                    'h': h_next.view(num_nodes, self.out_feats),
+                    'output': output.view(num_nodes, self.out_feats)
+                    }
+
+        graph.ndata['output'] = graph.ndata.pop('h')
+        graph.ndata['h'] = torch.zeros([num_nodes, self.out_feats])
+        for l in range(self.num_layers):
+            graph.update_all(rgcn_msg, rgcn_reduce, rgcn_apply)
+
+        graph.ndata.pop('h')
+        output = graph.ndata.pop('output')
+        graph.ndata['h'] = self.batchnorm(output)
+
+        return graph
+
+
+def make_batch(dataset, batch_size, h_dims):
+    graphs = [make_graph(dataset[i], i, ['UPOS']) for i in range(batch_size)]
+    batch = dgl.batch(graphs)
+    torch.manual_seed(0)
+    h = torch.randn(batch.number_of_nodes(), h_dims)
+    return batch, h
+
+
+def run(kernel, batch, h):
+    h = h.clone().requires_grad_()
+    batch.ndata['h'] = h
+    out = kernel(batch).ndata.pop('h')
+
+    # NOTE: the sum of the batchnormed output has no gradient
+    torch.manual_seed(1)
+    (out * torch.randn(out.shape)).sum().backward()
+    return out.detach(), h.grad
+
+
+def measure(job):
+    """Time and peak memory of one kernel, run in its own process"""
+    legacy, filename, batch_size, args = job
+    dataset = ConlluDataset(filename)
+    batch, h = make_batch(dataset, batch_size, args.h_dims)
+
+    torch.manual_seed(0)
+    Kernel = LegacyRGCNGRU if legacy else RGCNGRU
+    kernel = Kernel(args.h_dims, args.h_dims, args.h_layers)
+
+    # the peak resident size so far, in kB on linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    for i in range(args.repeat):
+        run(kernel, batch, h)
+    t = (time.perf_counter() - t0) / args.repeat
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    return batch.number_of_edges(), t, peak / 1024.
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    torch.set_num_threads(1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'synthetic.conllu')
+        write_synthetic_conllu(
+                filename, docs=max(args.batch_sizes), sentences=1
+                )
+        dataset = ConlluDataset(filename)
+
+        # both kernels should give the same outputs and gradients
+        torch.manual_seed(0)
+        legacy = LegacyRGCNGRU(args.h_dims, args.h_dims, args.h_layers)
+        kernel = RGCNGRU(args.h_dims, args.h_dims, args.h_layers)
+        kernel.load_state_dict(legacy.state_dict())
+        batch, h = make_batch(dataset, min(args.batch_sizes), args.h_dims)
+
+        # up to float32 rounding, relative to the largest value
+        def assert_close(a, b):
+            error = (a - b).abs().max() / a.abs().max()
+            assert error < 1e-4, error
+
+        for a, b in zip(run(legacy, batch, h), run(kernel, batch, h)):
+            assert_close(a, b)
+        for a, b in zip(legacy.parameters(), kernel.parameters()):
+            assert_close(a.grad, b.grad)
+
+        print('{:>8s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+            'batch', 'edges', 'per edge', 'grouped', 'per edge', 'grouped'
+            ))
+        print('{:>8s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+            '', '', 'ms', 'ms', 'MB peak', 'MB peak'
+            ))
+
+        # a fresh process per measurement, for the peak memory
+        context = multiprocessing.get_context('spawn')
+        for batch_size in args.batch_sizes:
+            results = []
+            for legacy in [True, False]:
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(
+                        measure, [(legacy, filename, batch_size, args)]
+                        ))
+            (edges, t_legacy, m_legacy), (_, t, m) = results
+            print('{:8d} {:8d} {:10.1f} {:10.1f} {:10.1f} {:10.1f}'.format(
+                batch_size, edges, 1000. * t_legacy, 1000. * t, m_legacy, m
+                ))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import tempfile
+import time
+
+from stroll.conllu import ConlluDataset, _read_conllu
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Benchmark loading a conllu file with many small documents'
+        )
+parser.add_argument(
+        '--docs',
+        nargs='*',
+        type=int,
+        default=[1000, 10000, 30000],
+        help='Number of documents in the synthetic corpus'
+        )
+parser.add_argument(
+        '--sentences',
+        type=int,
+        default=2,
+        help='Number of sentences per document'
+        )
+
+
+class LegacyConlluDataset(ConlluDataset):
+    """ConlluDataset.add as it was: doc_rank by a search over the doc_ids"""
+    def add(self, sentence):
+        if sentence.doc_id in self.doc_lengths:
+            sentence.sent_rank = self.doc_lengths[sentence.doc_id]
+            self.doc_lengths[sentence.doc_id] += 1
+        else:
+            sentence.sent_rank = 0
+            self.doc_lengths[sentence.doc_id] = 1
+
+        sentence.doc_rank = \
+            list(self.doc_lengths.keys()).index(sentence.doc_id)
+
+        sentence.dataset = self
+        self.sentences.append(sentence)
+        self._id_to_index = None
+
+
+def time_it(f):
+    t0 = time.perf_counter()
+    result = f()
+    return time.perf_counter() - t0, result
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    print('{:>8s} {:>10s} {:>12s} {:>12s} {:>12s}'.format(
+        'docs', 'sentences', 'load [s]', 'add [s]', 'legacy [s]'
+        ))
+    for docs in args.docs:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'synthetic.conllu')
+            write_synthetic_conllu(
+                    filename, docs=docs, sentences=args.sentences, tokens=8
+                    )
+
+            t_load, dataset = time_it(lambda: ConlluDataset(filename))
+
+            with open(filename, 'r') as f:
+                sentences = list(_read_conllu(f, filename))
+
+            def add_all(dataset):
+                for sentence in sentences:
+                    dataset.add(sentence)
+                return dataset
+
+            t_add, new = time_it(lambda: add_all(ConlluDataset()))
+            ranks = [s.doc_rank for s in new]
+
+            t_legacy, old = time_it(lambda: add_all(LegacyConlluDataset()))
+
+            # both should assign the same ranks
+            assert ranks == [s.doc_rank for s in old]
+
+            print('{:8d} {:10d} {:12.3f} {:12.3f} {:12.3f}'.format(
+                docs, len(dataset), t_load, t_add, t_legacy
+                ))
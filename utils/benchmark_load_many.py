@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import tempfile
+import time
+
+from stroll.conllu import ConlluDataset
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Benchmark loading a directory of conllu files in parallel'
+        )
+parser.add_argument(
+        '--files',
+        type=int,
+        default=16,
+        help='Number of synthetic files'
+        )
+parser.add_argument(
+        '--docs',
+        type=int,
+        default=1000,
+        help='Number of documents per file'
+        )
+parser.add_argument(
+        '--workers',
+        nargs='*',
+        type=int,
+        default=[1, 2, 4, 8],
+        help='Number of worker processes to try'
+        )
+
+
+def time_it(f):
+    t0 = time.perf_counter()
+    result = f()
+    return time.perf_counter() - t0, result
+
+
+def load(filenames, workers):
+    dataset = ConlluDataset()
+    dataset.load_many(filenames, workers=workers)
+    return dataset
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    print('cpus available: {}'.format(len(os.sched_getaffinity(0))))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = []
+        for i in range(args.files):
+            filename = os.path.join(tmpdir, 'synthetic{:03d}.conllu'.format(i))
+            write_synthetic_conllu(filename, docs=args.docs, seed=i)
+            filenames.append(filename)
+
+        # serial loading, as done before
+        def serial():
+            dataset = ConlluDataset()
+            for filename in filenames:
+                dataset._load(filename)
+            return dataset
+
+        t_serial, reference = time_it(serial)
+        ranks = [(s.doc_rank, s.sent_rank) for s in reference]
+
+        print('{:>8s} {:>10s} {:>10s}'.format('workers', 'time [s]', 'speedup'))
+        print('{:>8s} {:10.3f} {:10.2f}'.format('serial', t_serial, 1.0))
+        for workers in args.workers:
+            t, dataset = time_it(lambda: load(filenames, workers))
+
+            # the ranks should be the same as for serial loading
+            assert ranks == [(s.doc_rank, s.sent_rank) for s in dataset]
+
+            print('{:8d} {:10.3f} {:10.2f}'.format(
+                workers, t, t_serial / t
+                ))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import torch
+
+from stroll.graph import GraphDataset, batch_graphs
+from stroll.labels import FasttextEncoder
+from stroll.model import Net
+
+parser = argparse.ArgumentParser(
+        description='Check that Net.optimize_for_inference gives the same '
+        'labels, and compare the speed'
+        )
+parser.add_argument(
+        '--model',
+        dest='model_name',
+        help='Model to check',
+        required=True
+        )
+parser.add_argument(
+        'dataset',
+        help='Dataset in conllu format, or a binary corpus',
+        )
+parser.add_argument(
+        '--fasttext',
+        help='Fasttext model, when not the one the model was trained with'
+        )
+parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=50,
+        help='Batch size'
+        )
+parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of runs to time, the fastest is reported'
+        )
+
+
+def run(net, batches, repeat):
+    """The labels and chances of all batches, and the fastest time"""
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            results = [net.label(g) for g in batches]
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return results, best
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    torch.set_num_threads(1)
+
+    state_dict = torch.load(args.model_name)
+    hyperparams = state_dict.pop('hyperparams')
+
+    if 'WVEC' in hyperparams.features:
+        sentence_encoder = FasttextEncoder(
+                args.fasttext or hyperparams.fasttext
+                )
+    else:
+        sentence_encoder = None
+
+    # the graphs are made before timing, to time only the model
+    eval_set = GraphDataset(
+            args.dataset,
+            sentence_encoder=sentence_encoder,
+            features=hyperparams.features,
+            backend='torch'
+            )
+    batches = [
+        batch_graphs([
+            eval_set[i] for i in range(
+                start, min(start + args.batch_size, len(eval_set))
+                )
+            ])
+        for start in range(0, len(eval_set), args.batch_size)
+        ]
+    words = sum(len(g) for g in batches)
+
+    net = Net(
+            in_feats=eval_set.in_feats,
+            h_layers=hyperparams.h_layers,
+            h_dims=hyperparams.h_dims,
+            out_feats_a=2,
+            out_feats_b=19,
+            activation='relu'
+            )
+    net.load_state_dict(state_dict)
+    net.eval()
+
+    reference, t_net = run(net, batches, args.repeat)
+    optimized, t_optimized = run(
+            net.optimize_for_inference(), batches, args.repeat
+            )
+
+    # the labels should be identical, the chances up to float rounding
+    error = 0.
+    for a, b in zip(reference, optimized):
+        assert (a[0] == b[0]).all(), 'Frame labels differ'
+        assert (a[1] == b[1]).all(), 'Role labels differ'
+        error = max(
+            error,
+            (a[2] - b[2]).abs().max().item(),
+            (a[3] - b[3]).abs().max().item()
+            )
+    print('labels identical for {} words, chances differ at most {:.2e}'.format(
+        words, error
+        ))
+
+    print('{:>10s} {:>12s}'.format('model', 'words/sec'))
+    print('{:>10s} {:12.0f}'.format('Net', words / t_net))
+    print('{:>10s} {:12.0f}'.format('optimized', words / t_optimized))
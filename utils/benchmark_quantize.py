@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import torch
+from sklearn.metrics import classification_report
+
+from stroll.graph import GraphDataset, batch_graphs
+from stroll.labels import FasttextEncoder
+from stroll.model import Net, quantize_net
+from evaluate_srl import predict_labels
+
+parser = argparse.ArgumentParser(
+        description='Compare accuracy and throughput of the float and '
+        'dynamic int8 quantized model'
+        )
+parser.add_argument(
+        '--model',
+        dest='model_name',
+        help='Model to evaluate',
+        required=True
+        )
+parser.add_argument(
+        'dataset',
+        help='Evaluation dataset in conllu format, or a binary corpus',
+        )
+parser.add_argument(
+        '--fasttext',
+        help='Fasttext model, when not the one the model was trained with'
+        )
+parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=50,
+        help='Evaluation batch size'
+        )
+parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of runs to time, the fastest is reported'
+        )
+
+
+def score(net, batches, repeat):
+    """Scores as in evaluate_srl, and the words per second"""
+    words = sum(len(g) for g in batches)
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        gold_frames, predicted_frames, gold_roles, predicted_roles, _, _ = \
+            predict_labels(net, batches)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+
+    frames = classification_report(
+            gold_frames, predicted_frames, output_dict=True, zero_division=0
+            )
+    roles = classification_report(
+            gold_roles, predicted_roles, output_dict=True, zero_division=0
+            )
+    return {
+        'words/sec': words / best,
+        'frame acc': frames['accuracy'],
+        'frame F1': frames['macro avg']['f1-score'],
+        'role acc': roles['accuracy'],
+        'role F1': roles['macro avg']['f1-score'],
+        'labels': predicted_frames + predicted_roles
+        }
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    torch.set_num_threads(1)
+
+    state_dict = torch.load(args.model_name)
+    hyperparams = state_dict.pop('hyperparams')
+
+    if 'WVEC' in hyperparams.features:
+        sentence_encoder = FasttextEncoder(
+                args.fasttext or hyperparams.fasttext
+                )
+    else:
+        sentence_encoder = None
+
+    # the graphs are made before timing, to time only the model
+    eval_set = GraphDataset(
+            args.dataset,
+            sentence_encoder=sentence_encoder,
+            features=hyperparams.features,
+            backend='torch'
+            )
+    batches = [
+        batch_graphs([
+            eval_set[i] for i in range(
+                start, min(start + args.batch_size, len(eval_set))
+                )
+            ])
+        for start in range(0, len(eval_set), args.batch_size)
+        ]
+
+    net = Net(
+            in_feats=eval_set.in_feats,
+            h_layers=hyperparams.h_layers,
+            h_dims=hyperparams.h_dims,
+            out_feats_a=2,
+            out_feats_b=19,
+            activation='relu'
+            )
+    net.load_state_dict(state_dict)
+
+    results = [
+        ('float32', score(net, batches, args.repeat)),
+        ('int8', score(quantize_net(net), batches, args.repeat))
+        ]
+
+    columns = ['words/sec', 'frame acc', 'frame F1', 'role acc', 'role F1']
+    print(('{:>10s}' + ' {:>10s}' * len(columns)).format('model', *columns))
+    for name, result in results:
+        print(('{:>10s} {:10.0f}' + ' {:10.4f}' * (len(columns) - 1)).format(
+            name, *[result[c] for c in columns]
+            ))
+
+    same = sum(
+            a == b for a, b in zip(results[0][1]['labels'], results[1][1]['labels'])
+            )
+    print('int8 labels equal to float32: {:.2%}'.format(
+        same / len(results[0][1]['labels'])
+        ))
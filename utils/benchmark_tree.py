@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import time
+
+from stroll.graph import tree_edges, RELATION_TYPE_SELF, \
+        RELATION_TYPE_HEAD, RELATION_TYPE_CHILD
+from stroll.srl import make_frames
+from benchmark_frames import make_sentences
+
+parser = argparse.ArgumentParser(
+        description='Benchmark the per sentence cost of the graph edges and '
+        'frames, with the cached Sentence.tree against the token lookups'
+        )
+parser.add_argument(
+        '--lengths',
+        nargs='*',
+        type=int,
+        default=[10, 20, 50, 100, 200],
+        help='Sentence lengths in tokens'
+        )
+parser.add_argument(
+        '--sentences',
+        type=int,
+        default=200,
+        help='Number of sentences per length'
+        )
+parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of runs to time, the fastest is reported'
+        )
+
+
+def legacy_edges(sentence):
+    """The edges of graph_arrays as they were: from the HEAD per token"""
+    n = len(sentence)
+    words = []
+    heads = []
+    for i, token in enumerate(sentence):
+        if token.HEAD != '0' and token.HEAD != '_':
+            words.append(i)
+            heads.append(sentence.index(token.HEAD))
+
+    children = [0] * n
+    for head in heads:
+        children[head] += 1
+    src = list(words)
+    dst = list(heads)
+    rel_type = [RELATION_TYPE_HEAD.item()] * len(words)
+    norm = [1.0 / (3.0 * children[head]) for head in heads]
+
+    head_of = dict(zip(words, heads))
+    for i in range(n):
+        src.append(i)
+        dst.append(i)
+        rel_type.append(RELATION_TYPE_SELF.item())
+        norm.append(1.0 / 3.0)
+        if i in head_of:
+            src.append(head_of[i])
+            dst.append(i)
+            rel_type.append(RELATION_TYPE_CHILD.item())
+            norm.append(1.0 / 3.0)
+    return src, dst, rel_type, norm
+
+
+def legacy(sentence, frames):
+    legacy_edges(sentence)
+    if frames:
+        # the frames built a tree of their own
+        sentence._tree = None
+        make_frames(sentence)
+
+
+def cached(sentence, frames):
+    tree_edges(sentence.tree)
+    if frames:
+        make_frames(sentence)
+
+
+def run(sentences, step, frames, repeat):
+    """The fastest time per sentence, in microseconds"""
+    best = None
+    for r in range(repeat):
+        for sentence in sentences:
+            sentence.changed()
+        t0 = time.perf_counter()
+        for sentence in sentences:
+            step(sentence, frames)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return 1e6 * best / len(sentences)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    print('{:>6s} {:>12s} {:>12s} {:>14s} {:>14s}'.format(
+        'tokens', 'edges us', 'cached us', '+frames us', 'cached us'
+        ))
+    for length in args.lengths:
+        sentences = make_sentences(rng, length, args.sentences)
+        print('{:>6d} {:12.1f} {:12.1f} {:14.1f} {:14.1f}'.format(
+            length,
+            run(sentences, legacy, False, args.repeat),
+            run(sentences, cached, False, args.repeat),
+            run(sentences, legacy, True, args.repeat),
+            run(sentences, cached, True, args.repeat)
+            ))
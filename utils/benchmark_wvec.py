@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+
+from stroll.conllu import ConlluDataset
+from stroll.labels import FasttextEncoder
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Benchmark the word vector cache of the FasttextEncoder'
+        )
+parser.add_argument(
+        'fasttext',
+        help='Fasttext model (.bin)'
+        )
+parser.add_argument(
+        '--dataset',
+        help='Conllu file to encode, by default a synthetic one'
+        )
+parser.add_argument(
+        '--cache_sizes',
+        nargs='*',
+        type=int,
+        default=[0, 1000, 100000],
+        help='Cache sizes to try, 0 disables the cache'
+        )
+
+
+def uncached(encoder, sentence):
+    """FasttextEncoder.__call__ as it was: a new tensor per word"""
+    word_vectors = []
+    for token in sentence:
+        word_vectors.append(torch.Tensor(encoder.model[token.FORM]))
+    return word_vectors
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.dataset:
+        dataset = ConlluDataset(args.dataset)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'synthetic.conllu')
+            write_synthetic_conllu(filename, docs=2000)
+            dataset = ConlluDataset(filename)
+    words = sum(len(sentence) for sentence in dataset)
+
+    encoder = FasttextEncoder(args.fasttext, cache_size=0)
+    t0 = time.perf_counter()
+    reference = [uncached(encoder, sentence) for sentence in dataset]
+    t_uncached = time.perf_counter() - t0
+
+    print('{:>12s} {:>12s} {:>10s}'.format('cache size', 'words/sec', 'hit rate'))
+    print('{:>12s} {:12.0f} {:>10s}'.format(
+        'per word', words / t_uncached, '-'
+        ))
+    for cache_size in args.cache_sizes:
+        encoder = FasttextEncoder(args.fasttext, cache_size=cache_size)
+        t0 = time.perf_counter()
+        vectors = [encoder(sentence) for sentence in dataset]
+        t = time.perf_counter() - t0
+
+        # the vectors should be identical
+        for a, b in zip(reference, vectors):
+            assert torch.equal(torch.stack(a), b)
+
+        print('{:12d} {:12.0f} {:10.1%}'.format(
+            cache_size, words / t, encoder.statistics()['hit_rate']
+            ))
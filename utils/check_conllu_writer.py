@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import random
+
+from stroll.conllu import ConlluDataset, ConlluWriter, Sentence, Token
+from synthetic_conllu import synthetic_sentence
+
+parser = argparse.ArgumentParser(
+        description='Check that ConlluWriter writes the same conll-u as '
+        'ConlluDataset.__repr__ did, also for sentences without doc_id'
+        )
+parser.add_argument(
+        'datasets',
+        nargs='*',
+        help='Conllu files to check, besides the synthetic documents'
+        )
+
+
+def legacy_repr(sentences):
+    """ConlluDataset.__repr__ as it was, before ConlluWriter"""
+    res = ''
+    current_doc_id = ''
+    first = True
+    for sentence in sentences:
+        if not first:
+            res += '\n'
+
+        # keep track of the current document
+        if sentence.doc_id != current_doc_id:
+            current_doc_id = sentence.doc_id
+            if not first:
+                res += '\n'
+            res += '# newdoc id = {}\n'.format(sentence.doc_id)
+        res += sentence.__repr__()
+        res += '\n'
+
+        if first:
+            first = False
+    return res
+
+
+def written(sentences):
+    """The output of ConlluWriter, as the old __repr__ was written"""
+    fh = io.StringIO()
+    writer = ConlluWriter(fh)
+    for sentence in sentences:
+        writer.write(sentence)
+    writer.flush()
+
+    # the written file ends with an empty line, the repr did not
+    return fh.getvalue()[:-1]
+
+
+def make_sentences(doc_ids):
+    """A short synthetic sentence per doc_id"""
+    rng = random.Random(42)
+    sentences = []
+    for s, doc_id in enumerate(doc_ids):
+        sentence = Sentence(sent_id=str(s), full_text='')
+        for line in synthetic_sentence(rng, 5, str(s))[2:]:
+            sentence.add(Token(line.split('\t')))
+        sentence.doc_id = doc_id
+        sentences.append(sentence)
+    return sentences
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    cases = {
+        'no doc_id': ['', '', ''],
+        'no doc_id first': ['', '', 'a', 'a', 'b'],
+        'no doc_id later': ['a', 'a', '', '', 'b'],
+        'doc_id None': [None, None, 'a'],
+        'one document': ['a', 'a', 'a'],
+        'empty': []
+        }
+    for name, doc_ids in cases.items():
+        sentences = make_sentences(doc_ids)
+        assert written(sentences) == legacy_repr(sentences), \
+            'Output differs for {}'.format(name)
+        print('{}: same'.format(name))
+
+    for filename in args.datasets:
+        sentences = list(ConlluDataset(filename))
+        assert written(sentences) == legacy_repr(sentences), \
+            'Output differs for {}'.format(filename)
+        print('{}: same'.format(filename))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from torch.utils.data import DataLoader
+
+from stroll.conllu import ConlluDataset
+from stroll.graph import GraphStream, batch_graphs, split_batch
+from synthetic_conllu import write_synthetic_conllu
+
+parser = argparse.ArgumentParser(
+        description='Check that GraphStream gives back every sentence with '
+        'conllu(), also for batches larger than its default window'
+        )
+parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=1500,
+        help='Batch size, larger than the window of 1000 by default'
+        )
+parser.add_argument(
+        '--window',
+        type=int,
+        default=1000,
+        help='The default window of GraphStream'
+        )
+
+
+def stream(filename, batch_size, window):
+    """The sentences looked up after each batch, as in srl.predict"""
+    eval_set = GraphStream(
+            filename,
+            features=['UPOS'],
+            window=window,
+            backend='torch'
+            )
+    loader = DataLoader(
+            eval_set,
+            batch_size=batch_size,
+            num_workers=0,
+            collate_fn=batch_graphs
+            )
+
+    sentences = []
+    for gs in loader:
+        nodes = np.zeros(gs.number_of_nodes())
+        for index, _ in split_batch(gs, nodes):
+            sentences.append(eval_set.conllu(index))
+    return sentences
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'stream.conllu')
+        write_synthetic_conllu(filename, docs=args.batch_size, sentences=2)
+        expected = [str(sentence) for sentence in ConlluDataset(filename)]
+
+        # the window srl.py uses for --stream
+        window = max(args.window, args.batch_size)
+        sentences = stream(filename, args.batch_size, window)
+        assert [str(s) for s in sentences] == expected, \
+            'Streamed sentences differ'
+        print('window {}, batch size {}: {} sentences streamed'.format(
+            window, args.batch_size, len(sentences)
+            ))
+
+        # a window smaller than a batch loses sentences, with a clear error
+        if args.window < args.batch_size:
+            try:
+                stream(filename, args.batch_size, args.window)
+                raise AssertionError('A too small window was not detected')
+            except KeyError as e:
+                print('window {}, batch size {}: {}'.format(
+                    args.window, args.batch_size, e
+                    ))
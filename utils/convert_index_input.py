@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import argparse
+
+import torch
+
+from stroll.labels import get_dims_for_features
+from stroll.model import Net
+
+parser = argparse.ArgumentParser(
+        description='Convert a model on one-hot node features into a model '
+        'on label indices, see Net.to_index_input'
+        )
+parser.add_argument(
+        'model',
+        help='Model to convert, like models/srl.pt'
+        )
+parser.add_argument(
+        'output',
+        help='Converted model, for stroll.srl --model'
+        )
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    state_dict = torch.load(args.model)
+    hyperparams = state_dict.pop('hyperparams')
+
+    net = Net(
+            in_feats=state_dict['embedding.fc.0.weight'].shape[1],
+            h_layers=hyperparams.h_layers,
+            h_dims=hyperparams.h_dims,
+            out_feats_a=2,
+            out_feats_b=19,
+            activation='relu'
+            )
+    net.load_state_dict(state_dict)
+    net = net.to_index_input(hyperparams.features)
+
+    state_dict = net.state_dict()
+    state_dict['hyperparams'] = hyperparams
+    torch.save(state_dict, args.output)
+
+    print('{} label indices and {} word vector dims, saved to {}'.format(
+        get_dims_for_features(hyperparams.features),
+        net.in_feats - net.label_feats,
+        args.output
+        ))
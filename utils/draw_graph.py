@@ -46,9 +46,9 @@ def draw_graph(sentence, filename):
         else:
             G.add_node('n' + token.ID, label=token.FORM,
                        shape='box')
-    for token in sentence:
-        if token.HEAD != '0':
-            G.add_edge('n' + token.ID,  'n' + token.HEAD,
+    for token, head in zip(sentence, sentence.tree.heads):
+        if head >= 0:
+            G.add_edge('n' + token.ID,  'n' + sentence.tokens[head].ID,
                        label=token.DEPREL)
 
     # default to neato
@@ -5,7 +5,7 @@ import dgl
 from torch.utils.data import DataLoader
 
 from stroll.graph import GraphDataset
-from stroll.model import Net
+from stroll.model import Net, quantize_net
 from stroll.labels import FasttextEncoder
 from stroll.labels import frame_codec, role_codec
 
@@ -32,11 +32,28 @@ parser.add_argument(
         )
 parser.add_argument(
         'dataset',
-        help='Evaluation dataset in conllu format',
+        help='Evaluation dataset in conllu format, or a binary corpus',
+        )
+parser.add_argument(
+        '--cache_dir',
+        help='Directory to cache the encoded graphs in'
+        )
+parser.add_argument(
+        '--quantize',
+        default=False,
+        action='store_true',
+        help='Evaluate the model with dynamic int8 quantization'
         )
 
 
-def evaluate(net, evalloader, fig_name, batch_size=50):
+def predict_labels(net, evalloader, batch_size=50, progbar=None):
+    """
+    Label a dataset, and collect the gold and predicted labels.
+
+    Returns:
+        gold_frames, predicted_frames, gold_roles, and the best, second
+        best, and third best predicted_roles, as lists of str
+    """
     predicted_frames = []
     gold_frames = []
 
@@ -45,8 +62,6 @@ def evaluate(net, evalloader, fig_name, batch_size=50):
     predicted_roles3 = []
     gold_roles = []
 
-    progbar = Bar('Evaluating', max=len(evalloader))
-
     net.eval()
     with torch.no_grad():
         for g in evalloader:
@@ -80,9 +95,21 @@ def evaluate(net, evalloader, fig_name, batch_size=50):
             predicted_roles3 += role_codec.inverse_transform(pr3rd).tolist()
             gold_roles += role_codec.inverse_transform(gr).tolist()
 
-            progbar.next(batch_size)
+            if progbar:
+                progbar.next(batch_size)
+
+    if progbar:
+        progbar.finish()
+
+    return gold_frames, predicted_frames, gold_roles, \
+        predicted_roles1, predicted_roles2, predicted_roles3
 
-    progbar.finish()
+
+def evaluate(net, evalloader, fig_name, batch_size=50):
+    progbar = Bar('Evaluating', max=len(evalloader))
+    gold_frames, predicted_frames, gold_roles, \
+        predicted_roles1, predicted_roles2, predicted_roles3 = \
+        predict_labels(net, evalloader, batch_size, progbar)
 
     main_args = ['Arg0', 'Arg1', 'Arg2', 'Arg3', 'Arg4', 'Arg5']
     reduced_gold = []
@@ -204,7 +231,8 @@ if __name__ == '__main__':
     eval_set = GraphDataset(
             args.dataset,
             sentence_encoder=sentence_encoder,
-            features=hyperparams.features
+            features=hyperparams.features,
+            cache_dir=args.cache_dir
             )
     evalloader = DataLoader(
             eval_set,
@@ -224,4 +252,7 @@ if __name__ == '__main__':
     net.load_state_dict(state_dict)
 
     fig_name = args.model_name[:-2]
+    if args.quantize:
+        net = quantize_net(net)
+        fig_name += 'int8.'
     evaluate(net, evalloader, fig_name, batch_size=50)
@@ -1,8 +1,6 @@
 import argparse
 import logging
 
-import numpy as np
-
 import dgl
 
 import torch
@@ -10,7 +8,9 @@ from torch.utils.data import DataLoader
 
 from stroll.model import Net
 from stroll.graph import GraphDataset
+from stroll.conllu import ConlluWriter, open_file
 from stroll.labels import FasttextEncoder
+from stroll.srl import build_sentence_parts, find_frame
 
 
 parser = argparse.ArgumentParser(
@@ -66,86 +66,6 @@ class Frame():
         return string
 
 
-def adjacency_matrix(sentence):
-    # By mulitplying a position vector by the adjacency matrix,
-    # we can do one step along the dependency arc.
-    L = np.zeros([len(sentence)]*2, dtype=np.int)
-    for token in sentence:
-        if token.HEAD == "0":
-            continue
-        L[sentence.index(token.ID), sentence.index(token.HEAD)] = 1
-
-    return L
-
-
-def build_sentence_parts(sentence, subtree_ids):
-    to_descendants = adjacency_matrix(sentence)
-    # to_parent = to_descendants.transpos()
-
-    # Raise the matrix to the len(sentence) power; this covers the
-    # case where the tree has maximum depth. But first add the unity
-    # matrix, so the starting word, and all words we reach, keep a non-zero
-    # value.
-    is_descendant = to_descendants + np.eye(len(sentence), dtype=np.int)
-    is_descendant = np.linalg.matrix_power(is_descendant, len(sentence))
-
-    # collect the subtrees
-    subtrees = {}
-    for wid in subtree_ids:
-        ids, = np.where(is_descendant[:, sentence.index(wid)] > 0)
-        subtrees[wid] = [sentence.tokens[i].FORM for i in ids]
-
-    return subtrees
-
-
-def find_frame(sentence, id):
-    """Find a FRAME for the given word ID
-    1. look at the parent, and take that if it is a frame.
-    2. look at siblings: go to the parent, and consider all descendants"""
-
-    candidates = []
-
-    # # 1. look at the parent, and take that if it is a frame.
-    start = sentence[id]
-    if start.HEAD == '0':
-        # special case for the sentence's head
-        # set its parent to itself, so we will look at all descencents
-        # in the next step
-        parent = start
-    else:
-        parent = sentence[start.HEAD]
-        if parent.FRAME == 'rel':
-            return parent.ID
-        else:
-            # add the parent as candidate frame
-            candidates.append(parent)
-
-    # 2. look at siblings: go to the parent, and consider all descendants
-    #    but not itself
-    to_descendants = adjacency_matrix(sentence)
-    to_descendants[sentence.index(start.ID), sentence.index(parent.ID)] = 0
-
-    sibling_ids, = np.where(to_descendants[:, sentence.index(parent.ID)] > 0)
-    for sibling_id in sibling_ids:
-        sibling = sentence[sibling_id]
-        # allowed:     xcomp, compound:prt, ccomp, cop, obj? parataxis?
-        allowed = ['xcomp', 'compound:prt', 'ccomp', 'cop']
-        if sibling.DEPREL in allowed:
-            if sibling.FRAME == 'rel':
-                return sibling.ID
-            else:
-                candidates.append(sibling)
-        else:
-            # not allowed: conj, parataxis?, advcl, obl, acl
-            pass
-
-    for candidate in candidates:
-        if candidate.UPOS in ['VERB', 'AUX']:
-            return candidate.ID
-
-    return None
-
-
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
@@ -180,6 +100,12 @@ if __name__ == '__main__':
             )
     net.load_state_dict(state_dict)
 
+    if args.output:
+        outfile = open_file(args.output, 'w')
+        writer = ConlluWriter(outfile)
+    else:
+        writer = None
+
     net.eval()
     with torch.no_grad():
         for gs in evalloader:
@@ -210,7 +136,7 @@ if __name__ == '__main__':
                         arguments[token.ID] = token.ROLE
 
                 # get the sentence part for the arguments
-                subtrees = build_sentence_parts(sentence, arguments)
+                subtrees, _ = build_sentence_parts(sentence, arguments)
 
                 # Match the role to a frame:
                 for wid in arguments:
@@ -244,6 +170,9 @@ if __name__ == '__main__':
                     print(orphans)
                 print('\n')
 
-    if args.output:
-        with open(args.output, 'w') as f:
-            f.write(eval_set.dataset.__repr__())
+                if writer:
+                    writer.write(sentence)
+
+    if writer:
+        writer.flush()
+        outfile.close()
@@ -2,7 +2,8 @@
 import argparse
 import re
 
-from stroll.conllu import ConlluDataset, Sentence, Token
+from stroll.conllu import ConlluDataset, ConlluStream, ConlluWriter, \
+        Sentence, Token, open_file
 import stanza
 
 doc_and_sent_id = re.compile('(([^|]*)\|)?(([^|]*)\|)?(.*)')
@@ -36,6 +37,13 @@ parser.add_argument(
         action='store_true',
         help='Retain the column for coref'
         )
+parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of processes for reading conll2012 files, '
+        'defaults to the number of cpus'
+        )
 
 processor_dict = {
     # 'mwt': 'alpino',  # needed to get FEATS from the pos processor
@@ -47,7 +55,7 @@ processor_dict = {
 }
 
 
-def dataset_from_text_files(names=None, dataset=None):
+def dataset_from_text_files(names=None, dataset=None, writer=None):
     """
     Parse a set of files, and add them to a ConlluDataset.
     The files are parsed line-by-line, where the following format is assumed:
@@ -61,6 +69,7 @@ def dataset_from_text_files(names=None, dataset=None):
     Arguments:
         names:      list of str.  Files to process
         dataset:    ConlluDataset or None. Dataset to add the sentences to.
+        writer:     ConlluWriter or None. Write each sentence once parsed.
 
     Returns:
         ConlluDataset
@@ -70,7 +79,7 @@ def dataset_from_text_files(names=None, dataset=None):
 
     for name in names:
         sent_idx = 0
-        with open(name, 'r') as infile:
+        with open_file(name, 'r') as infile:
             for line in infile:
                 if len(line.strip()) > 0:
                     groups = doc_and_sent_id.match(line).groups()
@@ -109,18 +118,21 @@ def dataset_from_text_files(names=None, dataset=None):
                     sentence.doc_id = doc_id
                     sentence.sent_id = sent_id
                     dataset.add(sentence)
+                    if writer:
+                        writer.write(sentence)
 
                     sent_idx += 1
 
     return dataset
 
 
-def parse_dataset(dataset, nlp, keep_coref=False):
+def parse_dataset(dataset, nlp, keep_coref=False, writer=None):
     """
     Parse tokenized dataset with stanza,
     Overwriting all fields of the tokens (except FORM).
+    When a ConlluWriter is given, each sentence is written once parsed.
     """
-    for sentence in dataset.sentences:
+    for sentence in dataset:
         tokens = [[t.FORM for t in sentence]]
         parsed = nlp(tokens).to_dict()
         for token, parsed_token in zip(sentence.tokens, parsed[0]):
@@ -136,12 +148,23 @@ def parse_dataset(dataset, nlp, keep_coref=False):
             token.ROLE = '_'
             if not keep_coref:
                 token.COREF = '_'
+        sentence.changed()
+        if writer:
+            writer.write(sentence)
     return dataset
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
 
+    if not args.output:
+        output = args.input[0] + '_stanza.conll'
+    else:
+        output = args.output
+
+    outfile = open_file(output, 'w')
+    writer = ConlluWriter(outfile)
+
     if args.format == 'txt':
         nlp = stanza.Pipeline(
                 'nl',
@@ -149,7 +172,7 @@ if __name__ == '__main__':
                 package=None,
                 use_gpu=not args.nogpu
                 )
-        dataset = dataset_from_text_files(args.input)
+        dataset = dataset_from_text_files(args.input, writer=writer)
 
     elif args.format == 'conllu':
         nlp = stanza.Pipeline(
@@ -159,10 +182,11 @@ if __name__ == '__main__':
                 tokenize_pretokenized=True,
                 use_gpu=not args.nogpu
                 )
-        dataset = ConlluDataset()
         for input_file in args.input:
-            dataset._load(input_file)
-        dataset = parse_dataset(dataset, nlp, keep_coref=args.keep_coref)
+            parse_dataset(
+                    ConlluStream(input_file), nlp,
+                    keep_coref=args.keep_coref, writer=writer
+                    )
 
     elif args.format == 'conll2012':
         nlp = stanza.Pipeline(
@@ -173,14 +197,13 @@ if __name__ == '__main__':
                 use_gpu=not args.nogpu
                 )
         dataset = ConlluDataset()
-        for input_file in args.input:
-            dataset.load_conll2012(input_file)
-        dataset = parse_dataset(dataset, nlp, keep_coref=args.keep_coref)
-
-    if not args.output:
-        output = args.input[0] + '_stanza.conll'
-    else:
-        output = args.output
+        dataset.load_many(
+                args.input, workers=args.workers, format='conll2012'
+                )
+        parse_dataset(
+                dataset, nlp,
+                keep_coref=args.keep_coref, writer=writer
+                )
 
-    with open(output, 'w') as outfile:
-        outfile.write(dataset.__repr__())
+    writer.flush()
+    outfile.close()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import argparse
+import random
+
+from stroll.labels import UPOS, XPOS, FEATS, DEPREL, FRAMES, ROLES
+
+parser = argparse.ArgumentParser(
+        description='Write a synthetic conllu file, for benchmarking',
+        )
+parser.add_argument(
+        '--docs',
+        type=int,
+        default=1000,
+        help='Number of documents'
+        )
+parser.add_argument(
+        '--sentences',
+        type=int,
+        default=3,
+        help='Number of sentences per document'
+        )
+parser.add_argument(
+        '--tokens',
+        type=int,
+        default=15,
+        help='Average number of tokens per sentence'
+        )
+parser.add_argument(
+        'output',
+        help='Output filename'
+        )
+
+WORDS = ['de', 'het', 'een', 'kat', 'hond', 'loopt', 'zag', 'in', 'op',
+         'huis', 'tuin', 'en', 'niet', 'morgen', ',', '.']
+
+
+def synthetic_sentence(rng, length, sent_id):
+    """
+    Make a random, but well-formed, sentence in conllu format.
+
+    Every token gets a head to its left, or the root, so the dependency
+    tree has no cycles. All labels are taken from stroll.labels.
+
+    Returns:
+        list of str, the lines of the sentence
+    """
+    lines = []
+    forms = [rng.choice(WORDS) for i in range(length)]
+    lines.append('# sent_id = {}'.format(sent_id))
+    lines.append('# text = {}'.format(' '.join(forms)))
+
+    root = rng.randrange(length)
+    for i in range(length):
+        if i == root:
+            head = 0
+        elif i == 0 or rng.random() < 0.3:
+            head = root + 1
+        else:
+            head = rng.randrange(i) + 1
+        lines.append('\t'.join([
+            str(i + 1),
+            forms[i],
+            forms[i],
+            rng.choice(UPOS[1:]),
+            '|'.join(rng.sample(XPOS[1:], rng.randint(1, 4))),
+            '|'.join(rng.sample(FEATS[1:], rng.randint(1, 3))),
+            str(head),
+            'root' if head == 0 else rng.choice(DEPREL[1:]),
+            '_',
+            '_',
+            rng.choice(FRAMES),
+            rng.choice(ROLES),
+            '_'
+            ]))
+    return lines
+
+
+def write_synthetic_conllu(filename, docs=1000, sentences=3, tokens=15,
+                           seed=42):
+    """
+    Write a synthetic conllu file.
+
+    Arguments:
+        filename:   str, name of the output file
+        docs:       int, number of documents
+        sentences:  int, number of sentences per document
+        tokens:     int, average sentence length in tokens
+        seed:       int, seed for the random number generator
+    """
+    rng = random.Random(seed)
+    with open(filename, 'w') as f:
+        for d in range(docs):
+            f.write('# newdoc id = doc{:07d}\n'.format(d))
+            for s in range(sentences):
+                length = rng.randint(1, 2 * tokens - 1)
+                sent_id = 'doc{:07d}-s{:03d}'.format(d, s)
+                f.write('\n'.join(synthetic_sentence(rng, length, sent_id)))
+                f.write('\n\n')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    write_synthetic_conllu(
+            args.output,
+            docs=args.docs,
+            sentences=args.sentences,
+            tokens=args.tokens
+            )
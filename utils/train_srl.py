@@ -13,7 +13,7 @@ from sklearn.metrics import f1_score
 
 import dgl
 
-from stroll.graph import GraphDataset
+from stroll.graph import GraphDataset, BucketBatchSampler
 from stroll.model import Net
 from stroll.labels import FRAME_WEIGHTS, ROLE_WEIGHTS, \
         ROLE_TARGET_DISTRIBUTIONS
@@ -222,7 +222,7 @@ def train(net, trainloader, test_graph,
             optimizer.step()
 
             # diagnostics
-            word_count += len(g)
+            word_count += g.num_nodes()
             args.word_count = word_count
             writer.add_scalar('loss_frame', loss_frame.item(), word_count)
             writer.add_scalar('loss_role', loss_role.item(), word_count)
@@ -234,7 +234,7 @@ def train(net, trainloader, test_graph,
                 print('Elements {:08d} |'.format(word_count),
                       'AccF {:.4f} |'.format(accF),
                       'AccR {:.4f} |'.format(accR),
-                      'words/sec {:4.3f}'.format(len(g) / dur)
+                      'words/sec {:4.3f}'.format(g.num_nodes() / dur)
                       )
 
                 figure = plt.figure(figsize=[10., 10.])
@@ -275,7 +275,8 @@ def train(net, trainloader, test_graph,
                 optimizer.param_groups[0]['lr'],
                 word_count-1
                 )
-        scheduler.step()
+        if scheduler:
+            scheduler.step()
 
 
 def save_model(model):
@@ -311,6 +312,13 @@ parser.add_argument(
         default=50,
         help='Evaluation batch size.'
         )
+parser.add_argument(
+        '--max_tokens',
+        type=int,
+        default=None,
+        help='Batch sentences of similar length, with at most this many '
+        'tokens per batch, instead of using --batch_size'
+        )
 parser.add_argument(
         '--learning_rate',
         dest='learning_rate',
@@ -378,13 +386,28 @@ parser.add_argument(
         '--train',
         dest='train_set',
         default='train.conllu',
-        help='Train dataset in conllu format',
+        help='Train dataset in conllu format, or a binary corpus',
         )
 parser.add_argument(
         '--test',
         dest='test_set',
         default='quick.conllu',
-        help='Test dataset in conllu format',
+        help='Test dataset in conllu format, or a binary corpus',
+        )
+parser.add_argument(
+        '--lazy',
+        action='store_true',
+        help='Read the train sentences from disk when needed, '
+        'using a byte-offset index (filename.idx)'
+        )
+parser.add_argument(
+        '--cache_dir',
+        help='Directory to cache the encoded graphs in'
+        )
+parser.add_argument(
+        '--precompute',
+        action='store_true',
+        help='Encode the train set once, and keep it in shared memory'
         )
 
 if __name__ == '__main__':
@@ -396,7 +419,8 @@ if __name__ == '__main__':
         '_{:1.0e}'.format(args.learning_rate) + \
         '_{}{:1.2e}'.format(args.loss_function, args.loss_gamma) + \
         args.combine_loss + \
-        '_{:d}b'.format(args.batch_size) + \
+        ('_{:d}t'.format(args.max_tokens) if args.max_tokens else
+         '_{:d}b'.format(args.batch_size)) + \
         '_{:d}d'.format(args.h_dims) + \
         '_{:d}l'.format(args.h_layers) + \
         '_' + args.activation + \
@@ -418,15 +442,29 @@ if __name__ == '__main__':
     train_set = GraphDataset(
             args.train_set,
             sentence_encoder=sentence_encoder,
-            features=args.features
+            features=args.features,
+            lazy=args.lazy,
+            cache_dir=args.cache_dir,
+            precompute=args.precompute
+            )
+    if args.max_tokens:
+        trainloader = DataLoader(
+            train_set,
+            batch_sampler=BucketBatchSampler(
+                train_set.sentence_lengths(),
+                args.max_tokens
+                ),
+            num_workers=2,
+            collate_fn=dgl.batch
+            )
+    else:
+        trainloader = DataLoader(
+            train_set,
+            batch_size=args.batch_size,
+            shuffle=True,
+            num_workers=2,
+            collate_fn=dgl.batch
             )
-    trainloader = DataLoader(
-        train_set,
-        batch_size=args.batch_size,
-        shuffle=True,
-        num_workers=2,
-        collate_fn=dgl.batch
-        )
 
     logging.info(
             'Building test graph from {}.'.format(args.test_set)
@@ -434,9 +472,10 @@ if __name__ == '__main__':
     test_set = GraphDataset(
             args.test_set,
             sentence_encoder=sentence_encoder,
-            features=args.features
+            features=args.features,
+            cache_dir=args.cache_dir
             )
-    test_graph = dgl.batch([g for g in test_set])
+    test_graph = dgl.batch([test_set[i] for i in range(len(test_set))])
 
     logging.info('Building model.')
     net = Net(